@@ -1,23 +1,37 @@
 import streamlit as st
 import plotly.express as px
 import pandas as pd
+# First, so the shared data path imported below is timed from the very first run
+from profiler import profile_rerun
+from charts import cached_figure, cached_frame, date_bar, filter_state
+from data_loader import date_bounds, load_dataset, pin_snapshot
+from filters import sidebar_filters
+from rollup import summarize
+from rolling import show_rolling_trends
+from timeseries import TICK_FORMATS
 
 # Set page configuration
 st.set_page_config(page_title="Healthcare!!!", page_icon=":bar_chart:", layout="wide")
 
+# Stage timings for this run; shown in the sidebar with ?debug=1
+profile = profile_rerun("Overview")
+
 st.title(" :bar_chart: Helpman Healthcare Interactive Dashboard")
 st.markdown('<style>div.block-container{padding-top:2rem;}</style>', unsafe_allow_html=True)
 
-df = pd.read_csv("fake_healthcare_2.csv")
-#st.dataframe(df.head())
+# Columns used by this page; the page frame is a view of just these columns of the shared snapshot
+COLUMNS = [
+    'departments', 'refer_reason', 'staff_patient_ratio', 'day_of_week', 'daily_visits',
+    'daily_admissions', 'patient_days', 'daily_discharge', 'wait_time', 'daily_revenue',
+    'ctf_daily', 'daily_profit', 'beds_in_use', 'total_beds', 'occupancy_rate', 'readmission_rate',
+    'bed_turnover', 'employee_count', 'employee_resign', 'employee_turnover', 'equip_use'
+]
 
-# Ensure the date column is datetime and set as index
-df['date'] = pd.to_datetime(df['date'])
-df.set_index('date', inplace=True)
+# One snapshot for the whole rerun, so rows appended mid-run can't split the page frame from its filters and caches
+pin_snapshot()
 
-# Getting the min and max date
-startDate = df.index.min()
-endDate = df.index.max()
+# Getting the min and max date (the first and last rows of the date-sorted snapshot, without scanning it)
+startDate, endDate = date_bounds()
 
 st.sidebar.header("Filter by Date")
 date1 = st.sidebar.date_input("Start Date", startDate)
@@ -27,30 +41,21 @@ date2 = st.sidebar.date_input("End Date", endDate)
 date1 = pd.to_datetime(date1)
 date2 = pd.to_datetime(date2)
 
-# Filter the DataFrame based on selected dates
-df = df[(df.index >= date1) & (df.index <= date2)].copy()
+# Only the selected date range: a binary-searched slice of the snapshot, not a scan or a copy
+df = load_dataset(COLUMNS, date1, date2)
 
 st.sidebar.header("Choose your filter: ")
-# Create filter for Department
-department = st.sidebar.multiselect("Pick your department", df["departments"].unique())
-if not department: 
-    df2 = df.copy()
-else:
-    df2 = df[df["departments"].isin(department)]
-
-# Create filter for Refer Reason
-refer = st.sidebar.multiselect("Pick the refer reason", df2["refer_reason"].unique())
-if not refer:
-    df3 = df2.copy()
-else:
-    df3 = df2[df2["refer_reason"].isin(refer)]
-
-# Create filter for Staff to Patient Ratio
-staff_patient = st.sidebar.multiselect("Pick the Staff to Patient Ratio", df3["staff_patient_ratio"].unique())
-if not staff_patient:
-    filtered_df = df3.copy()
-else:
-    filtered_df = df3[df3["staff_patient_ratio"].isin(staff_patient)]
+# Every filter is applied as one combined mask; options only list values still present
+filtered_df, selections = sidebar_filters(df, date1, date2, [
+    ("departments", "Pick your department"),
+    ("refer_reason", "Pick the refer reason"),
+    ("staff_patient_ratio", "Pick the Staff to Patient Ratio"),
+])
+
+# KPIs and department charts are answered from the pre-aggregated rollup cube
+summary = summarize(filtered_df, date1, date2, selections)
+# Figures are cached on this state: widgets that don't feed a chart don't rebuild it
+state = filter_state(date1, date2, selections)
 
 # Sidebar navigation
 st.sidebar.header("Navigation")
@@ -60,15 +65,14 @@ page = st.sidebar.selectbox("Select a page", pages)
 # Page content
 if page == "Overview":
     st.header("Overview")
-    overview_df = filtered_df.copy()
 
     # Calculate summary metrics
     metrics = {
-        "avg_length_of_stay": overview_df['patient_days'].mean() if 'patient_days' in overview_df.columns else None,
-        "total_beds": overview_df['total_beds'].sum() if 'total_beds' in overview_df.columns else None,
-        "occupied_beds": overview_df['beds_in_use'].sum() if 'beds_in_use' in overview_df.columns else None,
-        "total_admissions": overview_df['daily_admissions'].sum() if 'daily_admissions' in overview_df.columns else None,
-        "avg_treatment_cost": overview_df['daily_revenue'].mean() if 'daily_revenue' in overview_df.columns else None,
+        "avg_length_of_stay": summary.mean('patient_days') if 'patient_days' in summary.metrics else None,
+        "total_beds": summary.total('total_beds') if 'total_beds' in summary.metrics else None,
+        "occupied_beds": summary.total('beds_in_use') if 'beds_in_use' in summary.metrics else None,
+        "total_admissions": summary.total('daily_admissions') if 'daily_admissions' in summary.metrics else None,
+        "avg_treatment_cost": summary.mean('daily_revenue') if 'daily_revenue' in summary.metrics else None,
     }
 
     available_beds = metrics["total_beds"] - metrics["occupied_beds"] if metrics["total_beds"] and metrics["occupied_beds"] else None
@@ -93,22 +97,34 @@ if page == "Overview":
         col5.metric("Total Admissions", f"{metrics['total_admissions']:,}")
 
     # Additional overview charts
-    if 'daily_admissions' in overview_df.columns and 'departments' in overview_df.columns:
-        admissions_by_department = overview_df.groupby('departments')['daily_admissions'].sum().reset_index()
-        admissions_by_department = admissions_by_department[admissions_by_department['daily_admissions'] > 0]
-        if not admissions_by_department.empty:
-            st.subheader("Department Distribution of Admitted Patients")
+    if 'daily_admissions' in summary.metrics and 'departments' in filtered_df.columns:
+        def admissions_chart():
+            admissions_by_department = summary.by('departments', daily_admissions='sum').reset_index()
+            admissions_by_department = admissions_by_department[admissions_by_department['daily_admissions'] > 0]
+            if admissions_by_department.empty:
+                return None
             fig = px.bar(admissions_by_department, x='departments', y='daily_admissions', title='Admissions by Department')
             fig.update_layout(yaxis_tickformat=',')
+            return fig
+
+        fig = cached_figure("Overview", "admissions_by_department", state, admissions_chart)
+        if fig is not None:
+            st.subheader("Department Distribution of Admitted Patients")
             st.plotly_chart(fig, use_container_width=True)
 
-    if 'daily_revenue' in overview_df.columns and 'departments' in overview_df.columns:
-        revenue_by_department = overview_df.groupby('departments')['daily_revenue'].mean().reset_index()
-        revenue_by_department = revenue_by_department[revenue_by_department['daily_revenue'] > 0]
-        if not revenue_by_department.empty:
-            st.subheader("Average Treatment Costs")
+    if 'daily_revenue' in summary.metrics and 'departments' in filtered_df.columns:
+        def treatment_cost_chart():
+            revenue_by_department = summary.by('departments', daily_revenue='mean').reset_index()
+            revenue_by_department = revenue_by_department[revenue_by_department['daily_revenue'] > 0]
+            if revenue_by_department.empty:
+                return None
             fig = px.bar(revenue_by_department, x='departments', y='daily_revenue', title='Average Treatment Costs by Department')
             fig.update_layout(yaxis_tickformat=',')
+            return fig
+
+        fig = cached_figure("Overview", "treatment_cost_by_department", state, treatment_cost_chart)
+        if fig is not None:
+            st.subheader("Average Treatment Costs")
             st.plotly_chart(fig, use_container_width=True)
 
 elif page == "Doctors":
@@ -117,140 +133,178 @@ elif page == "Doctors":
 
 elif page == "Hospital Performance":
     st.header("Hospital Performance")
-    performance_df = filtered_df.copy()
+    performance_df = filtered_df
 
     metrics = ['patient_days', 'daily_discharge', 'wait_time', 'daily_profit', 'occupancy_rate', 'readmission_rate', 'bed_turnover']
     for metric in metrics:
         if metric in performance_df.columns:
             st.subheader(f"{metric.replace('_', ' ').title()} by Date")
-            fig = px.bar(performance_df, x=performance_df.index, y=metric, title=f"{metric.replace('_', ' ').title()} by Date")
+            fig = cached_figure("Overview", f"{metric}_by_date", state, lambda: date_bar(summary, metric))
             st.plotly_chart(fig, use_container_width=True)
+
+    # 7-/28-day rolling averages per department over the chosen dates and filters
+    st.subheader("Rolling Trends")
+    show_rolling_trends("Overview", date1, date2, performance_df, selections)
     # Add relevant visualizations and metrics for Hospital Performance
 
 elif page == "Hospital Staff":
     st.header("Hospital Staff")
-    staff_df = filtered_df.copy()
+    staff_df = filtered_df
 
     metrics = ['employee_count', 'employee_resign', 'employee_turnover', 'staff_patient_ratio']
     for metric in metrics:
         if metric in staff_df.columns:
             st.subheader(f"{metric.replace('_', ' ').title()} by Date")
-            fig = px.bar(staff_df, x=staff_df.index, y=metric, title=f"{metric.replace('_', ' ').title()} by Date")
+            fig = cached_figure("Overview", f"{metric}_by_date", state, lambda: date_bar(summary, metric))
             st.plotly_chart(fig, use_container_width=True)
     # Add relevant visualizations and metrics for Hospital Staff
 
 elif page == "Patients":
     st.header("Patients")
-    patients_df = filtered_df.copy()
+    patients_df = filtered_df
 
     metrics = ['daily_visits', 'daily_admissions', 'patient_days', 'daily_discharge', 'wait_time', 'staff_patient_ratio']
     for metric in metrics:
         if metric in patients_df.columns:
             st.subheader(f"{metric.replace('_', ' ').title()} by Date")
-            fig = px.bar(patients_df, x=patients_df.index, y=metric, title=f"{metric.replace('_', ' ').title()} by Date")
+            fig = cached_figure("Overview", f"{metric}_by_date", state, lambda: date_bar(summary, metric))
             st.plotly_chart(fig, use_container_width=True)
             # Add relevant visualizations and metrics for Quality of Care
 
 elif page == "Quality of Care":
     st.header("Quality of Care")
-    quality_df = filtered_df.copy()
+    quality_df = filtered_df
 
     metrics = ['refer_reason', 'staff_patient_ratio', 'equip_use', 'patient_days']
     for metric in metrics:
         if metric in quality_df.columns:
             st.subheader(f"{metric.replace('_', ' ').title()} by Date")
-            fig = px.bar(quality_df, x=quality_df.index, y=metric, title=f"{metric.replace('_', ' ').title()} by Date")
+            fig = cached_figure("Overview", f"{metric}_by_date", state, lambda: date_bar(summary, metric))
             st.plotly_chart(fig, use_container_width=True)
     # Add relevant visualizations and metrics for Quality of Care
 
 elif page == "Revenue Streams":
     st.header("Revenue Streams")
-    revenue_df = filtered_df.copy()
+    revenue_df = filtered_df
 
     metrics = ['daily_profit', 'daily_revenue']
     for metric in metrics:
         if metric in revenue_df.columns:
             st.subheader(f"{metric.replace('_', ' ').title()} by Date")
-            fig = px.bar(revenue_df, x=revenue_df.index, y=metric, title=f"{metric.replace('_', ' ').title()} by Date")
+            fig = cached_figure("Overview", f"{metric}_by_date", state, lambda: date_bar(summary, metric))
             st.plotly_chart(fig, use_container_width=True)
             # Add relevant visualizations and metrics for Quality of Care
 
     # Donut Chart for Revenue Streams
     if 'daily_revenue' in revenue_df.columns:
         st.subheader("Profit Distribution")
-        revenue_summary = revenue_df[['daily_revenue']].sum().reset_index()
-        revenue_summary.columns = ['Metric', 'Total']
-        fig = px.pie(revenue_summary, values='Total', names='Metric', title='profit Distribution', hole=0.5)
+        def profit_distribution_chart():
+            revenue_summary = pd.Series({'daily_revenue': summary.total('daily_revenue')}).reset_index()
+            revenue_summary.columns = ['Metric', 'Total']
+            return px.pie(revenue_summary, values='Total', names='Metric', title='profit Distribution', hole=0.5)
+
+        fig = cached_figure("Overview", "profit_distribution", state, profit_distribution_chart)
         st.plotly_chart(fig, use_container_width=True)
 # Detailed Pages
 st.header("Detailed Analysis")
-department_df = filtered_df.groupby('departments').agg({'beds_in_use': 'sum', 'total_beds': 'first'})
-department_df = department_df[department_df['beds_in_use'] > 0]
+
+
+def department_beds():
+    department_df = summary.by('departments', beds_in_use='sum', total_beds='first')
+    return department_df[department_df['beds_in_use'] > 0]
+
+
+def beds_in_use_chart():
+    department_df = department_beds()
+    if department_df.empty:
+        return None
+    fig = px.bar(department_df, x=department_df.index, y='beds_in_use',
+                 text=[f'{x:,.2f}' for x in department_df['beds_in_use']],
+                 template="seaborn", color='beds_in_use', color_continuous_scale='Viridis')
+    fig.update_layout(yaxis_tickformat=',')
+    return fig
+
+
+def available_beds_chart():
+    department_df = department_beds()
+    if department_df.empty:
+        return None
+    department_df['available_beds'] =  department_df['beds_in_use'] - department_df['total_beds']
+    fig = px.bar(department_df, x=department_df.index, y='available_beds',
+                 text=[f'{x:,.2f}' for x in department_df['available_beds']],
+                 template="seaborn", color='available_beds', color_continuous_scale='Viridis')
+    fig.update_layout(yaxis_tickformat=',')
+    return fig
+
 
 col1, col2 = st.columns(2)
 
-if not department_df.empty:
+beds_in_use_fig = cached_figure("Overview", "beds_in_use", state, beds_in_use_chart)
+if beds_in_use_fig is not None:
     with col1:
         st.subheader("Department Bed In Use")
-        fig = px.bar(department_df, x=department_df.index, y='beds_in_use',
-                     text=[f'{x:,.2f}' for x in department_df['beds_in_use']],
-                     template="seaborn", color='beds_in_use', color_continuous_scale='Viridis')
-        fig.update_layout(yaxis_tickformat=',')
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(beds_in_use_fig, use_container_width=True)
 
     with col2:
         st.subheader("Department Available Beds")
-        department_df['available_beds'] =  department_df['beds_in_use'] - department_df['total_beds'] 
-        
-        
-        fig = px.bar(department_df, x=department_df.index, y='available_beds',
-                     text=[f'{x:,.2f}' for x in department_df['available_beds']],
-                     template="seaborn", color='available_beds', color_continuous_scale='Viridis')
-        fig.update_layout(yaxis_tickformat=',')
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(cached_figure("Overview", "available_beds", state, available_beds_chart), use_container_width=True)
 
-# Ensure 'patient_days' is included in the aggregation
-department_df2 = filtered_df.groupby('departments').agg({
-    'daily_visits': 'sum',
-    'daily_admissions': 'sum',
-    'patient_days': 'sum' if 'patient_days' in filtered_df.columns else None
-}).reset_index()
 
-# Remove rows where all values are zero or NaN
-department_df2 = department_df2[(department_df2[['daily_visits', 'daily_admissions', 'patient_days']].T != 0).any()]
+def department_metrics():
+    # Ensure 'patient_days' is included in the aggregation
+    department_df2 = summary.by('departments', daily_visits='sum', daily_admissions='sum', patient_days='sum').reset_index()
 
-# Check if 'patient_days' exists in the DataFrame before melting
-value_vars = ['daily_visits', 'daily_admissions']
-if 'patient_days' in department_df2.columns:
-    value_vars.append('patient_days')
+    # Remove rows where all values are zero or NaN
+    department_df2 = department_df2[(department_df2[['daily_visits', 'daily_admissions', 'patient_days']].T != 0).any()]
 
-department_df_melted = department_df2.melt(id_vars='departments',
-                                           value_vars=value_vars,
-                                           var_name='Metric', value_name='Count')
+    # Check if 'patient_days' exists in the DataFrame before melting
+    value_vars = ['daily_visits', 'daily_admissions']
+    if 'patient_days' in department_df2.columns:
+        value_vars.append('patient_days')
 
-# Plotting
-with col1:
-    st.subheader("Department Daily Visit and Admissions")
-    fig = px.bar(department_df_melted, x='departments', y='Count', color='Metric', barmode='group',
+    return department_df2.melt(id_vars='departments',
+                               value_vars=value_vars,
+                               var_name='Metric', value_name='Count')
+
+
+def department_metrics_chart():
+    fig = px.bar(department_metrics(), x='departments', y='Count', color='Metric', barmode='group',
                  labels={'Count': 'Count', 'departments': 'Departments'},
                  title='Department Metrics')
     fig.update_layout(yaxis_tickformat=',')
+    return fig
+
+
+def department_distribution_chart():
+    return px.pie(department_metrics(), values='Count', names='Metric',
+                  title='Department Metrics Distribution',
+                  hole=0.5)
+
+
+# Plotting
+with col1:
+    st.subheader("Department Daily Visit and Admissions")
+    fig = cached_figure("Overview", "department_metrics", state, department_metrics_chart)
     st.plotly_chart(fig, use_container_width=True)
 
 with col2:
     st.subheader("Department Metrics Distribution")
-    fig = px.pie(department_df_melted, values='Count', names='Metric',
-                 title='Department Metrics Distribution',
-                 hole=0.5)
+    fig = cached_figure("Overview", "department_distribution", state, department_distribution_chart)
     st.plotly_chart(fig, use_container_width=True)
 
+
+def visits_over_time_chart():
+    linechart = summary.over_time("W", daily_visits="sum").reset_index()
+    fig2 = px.line(linechart, x="weekly", y="daily_visits", labels={"Patient": "count"}, height=500, width=1000, template="gridon")
+    fig2.update_xaxes(tickformat=TICK_FORMATS["W"])
+    fig2.update_layout(yaxis_tickformat=',')
+    return fig2
+
+
 # Time Series Analysis
-filtered_df["weekly"] = filtered_df.index.to_period("W")
 if 'daily_visits' in filtered_df.columns:
     st.subheader('Time Series Analysis')
-    linechart = pd.DataFrame(filtered_df.groupby(filtered_df["weekly"].dt.strftime("%b : %d"))["daily_visits"].sum()).reset_index()
-    fig2 = px.line(linechart, x="weekly", y="daily_visits", labels={"Patient": "count"}, height=500, width=1000, template="gridon")
-    fig2.update_layout(yaxis_tickformat=',')
+    fig2 = cached_figure("Overview", "weekly_visits", state, visits_over_time_chart)
     st.plotly_chart(fig2, use_container_width=True)
 
 # Department Metrics Filter
@@ -260,13 +314,26 @@ selected_metrics = st.sidebar.multiselect("Select metrics to display", metrics)
 
 # Filter and display department metrics if selected
 if selected_metrics:
-    filtered_metrics_df = df.groupby('departments')[selected_metrics].sum().reset_index()
-    
-    # Remove departments with NaN or zero values for selected metrics
-    for metric in selected_metrics:
-        if metric in filtered_metrics_df.columns:
-            filtered_metrics_df = filtered_metrics_df[filtered_metrics_df[metric].notna() & (filtered_metrics_df[metric] > 0)]
-    
+    # Charts here depend on the date range and the chosen metrics only
+    metrics_state = filter_state(date1, date2, metrics=selected_metrics)
+
+    def department_metrics_table():
+        # Department totals over the date range only (the sidebar filters don't apply here)
+        table = summarize(df, date1, date2).by('departments', **{metric: 'sum' for metric in selected_metrics}).reset_index()
+
+        # Remove departments with NaN or zero values for selected metrics
+        for metric in selected_metrics:
+            if metric in table.columns:
+                table = table[table[metric].notna() & (table[metric] > 0)]
+
+        # Cost Analysis: Calculate cost from revenue and profit
+        if 'daily_revenue' in table.columns and 'daily_profit' in table.columns:
+            table = table.assign(daily_cost=table['daily_revenue'] - table['daily_profit'])
+        return table
+
+    # Aggregated only when the date range or the metric choice changes
+    filtered_metrics_df = cached_frame("Overview", "department_metrics_table", metrics_state, department_metrics_table)
+
     # Check if there are any departments left after filtering
     if filtered_metrics_df.empty:
         st.write("No data available for the selected metrics.")
@@ -274,23 +341,25 @@ if selected_metrics:
         st.subheader("Department Metrics")
         for metric in selected_metrics:
             if metric in filtered_metrics_df.columns:
-                fig = px.bar(filtered_metrics_df, x='departments', y=metric,
-                             title=f"{metric.replace('_', ' ').title()} by Department")
+                fig = cached_figure("Overview", f"{metric}_by_department", metrics_state, lambda: px.bar(
+                    filtered_metrics_df, x='departments', y=metric,
+                    title=f"{metric.replace('_', ' ').title()} by Department"))
                 st.plotly_chart(fig, use_container_width=True)
         
         # Profit Level Analysis
         if 'daily_profit' in filtered_metrics_df.columns:
             st.subheader("Profit Level by Department")
-            fig = px.bar(filtered_metrics_df, x='departments', y='daily_profit',
-                         title='Daily Profit by Department')
+            fig = cached_figure("Overview", "profit_by_department", metrics_state, lambda: px.bar(
+                filtered_metrics_df, x='departments', y='daily_profit',
+                title='Daily Profit by Department'))
             st.plotly_chart(fig, use_container_width=True)
         
-        # Cost Analysis: Calculate cost from revenue and profit
-        if 'daily_revenue' in filtered_metrics_df.columns and 'daily_profit' in filtered_metrics_df.columns:
-            filtered_metrics_df['daily_cost'] = filtered_metrics_df['daily_revenue'] - filtered_metrics_df['daily_profit']
+        # Cost Analysis
+        if 'daily_cost' in filtered_metrics_df.columns:
             st.subheader("Cost Analysis")
-            fig = px.bar(filtered_metrics_df, x='departments', y='daily_cost',
-                         title='Daily Cost by Department')
+            fig = cached_figure("Overview", "cost_by_department", metrics_state, lambda: px.bar(
+                filtered_metrics_df, x='departments', y='daily_cost',
+                title='Daily Cost by Department'))
             st.plotly_chart(fig, use_container_width=True)
         
         # Insights
@@ -326,26 +395,41 @@ selected_days = st.sidebar.multiselect("Select days of the week", days_of_week)
 
 # Filter and display data based on selected days
 if selected_days:
-    filtered_days_df = df[df['day_of_week'].isin(selected_days)]
-    
+    # These charts depend on the date range and the chosen days only
+    days_state = filter_state(date1, date2, days=selected_days)
+
+    def day_of_week_table():
+        filtered_days_df = df[df['day_of_week'].isin(selected_days)]
+        totals = [metric for metric in ('daily_visits', 'daily_revenue') if metric in filtered_days_df.columns]
+        return filtered_days_df.groupby('day_of_week', observed=True)[totals].sum().reset_index()
+
+    # The rows of the chosen days are only masked out when the dates or the days change
+    day_of_week_totals = cached_frame("Overview", "day_of_week_table", days_state, day_of_week_table)
+
     # Check if there is data after filtering
-    if filtered_days_df.empty:
+    if day_of_week_totals.empty:
         st.write("No data available for the selected days of the week.")
     else:
         st.subheader("Day of the Week Analysis")
-        
+
+        def visits_by_day_chart():
+            return px.bar(day_of_week_totals, x='day_of_week', y='daily_visits',
+                          title='Total Daily Visits by Day of the Week')
+
+        def revenue_by_day_chart():
+            return px.pie(day_of_week_totals, values='daily_revenue', names='day_of_week',
+                          title='Profit Distribution by Day of the Week', hole=0.5)
+
         # Bar Plot for Metrics by Day of the Week
-        if 'daily_visits' in filtered_days_df.columns:
-            day_of_week_visits = filtered_days_df.groupby('day_of_week')['daily_visits'].sum().reset_index()
-            fig = px.bar(day_of_week_visits, x='day_of_week', y='daily_visits',
-                         title='Total Daily Visits by Day of the Week')
+        if 'daily_visits' in day_of_week_totals.columns:
+            fig = cached_figure("Overview", "visits_by_day_of_week", days_state, visits_by_day_chart)
             st.plotly_chart(fig, use_container_width=True)
         
         # Pie Chart for Metrics Distribution by Day of the Week
-        if 'daily_revenue' in filtered_days_df.columns:
-            day_of_week_revenue = filtered_days_df.groupby('day_of_week')['daily_revenue'].sum().reset_index()
-            fig = px.pie(day_of_week_revenue, values='daily_revenue', names='day_of_week',
-                         title='Profit Distribution by Day of the Week', hole=0.5)
+        if 'daily_revenue' in day_of_week_totals.columns:
+            fig = cached_figure("Overview", "revenue_by_day_of_week", days_state, revenue_by_day_chart)
             st.plotly_chart(fig, use_container_width=True)
 else:
-    st.write("No days of the week selected.")
\ No newline at end of file
+    st.write("No days of the week selected.")
+
+profile.finish()
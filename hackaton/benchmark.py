@@ -0,0 +1,292 @@
+"""Benchmark the dashboard pages' data path on generated datasets.
+
+Every page is run headlessly (Streamlit's AppTest) against a synthetic dataset
+of each size, and each rerun is split into the stages timed by `profiler`
+(load, filter cascade, groupby, figure build, serialization, other).
+
+For each stage the wall time and peak RSS are recorded, and for each rerun
+the figure payload sent to the browser. Results are written as JSON and can be
+compared with an earlier run:
+
+    python benchmark.py --sizes 10000 1000000 10000000 --output bench.json
+    python benchmark.py --compare bench.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+# Dataset sizes benchmarked by default
+SIZES = [10_000, 1_000_000, 10_000_000]
+
+# Days covered by the generated datasets
+DAYS = 730
+
+# Generated datasets are kept here and reused between runs
+DATA_DIR = "bench_data"
+
+# A stage counts as a regression when it is this much slower than the baseline
+REGRESSION_TOLERANCE = 1.25
+
+# Stages shorter than this in the baseline are too noisy to compare
+MIN_COMPARED_SECONDS = 0.01
+
+# Stages reported per rerun, in profiler order
+STAGES = ["parse", "load", "filter", "groupby", "figure", "serialize", "other"]
+
+# Views of Overview.py, picked with its "Select a page" box
+OVERVIEW_VIEWS = ["Overview", "Doctors", "Hospital Performance", "Hospital Staff", "Patients", "Quality of Care",
+                  "Revenue Streams"]
+
+# Pages without a data path (static or LLM-driven) are not benchmarked
+SKIPPED_PAGES = ["Chatbot.py", "Emergency-department.py", "Public-Health-Performance.py", "Revenue-leakage.py",
+                 "Utility-bills.py"]
+
+# How often peak memory is sampled, in seconds
+RSS_SAMPLE_SECONDS = 0.002
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss():
+    """Resident set size of this process in bytes (Linux; peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """Peak RSS per profiler stage, sampled from a background thread.
+
+    Samples go to the innermost stage of the script run in progress, or to
+    "other" outside any stage.
+    """
+
+    def __init__(self):
+        import profiler
+
+        self._profiler = profiler
+        self._lock = threading.Lock()
+        self.reset()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def reset(self):
+        with self._lock:
+            self.peak = dict.fromkeys(STAGES, 0)
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self.sample()
+
+    def sample(self):
+        rss = current_rss()
+        active = self._profiler.active_profiles()
+        stage = (active[0].current_stage if active else None) or "other"
+        with self._lock:
+            self.peak[stage] = max(self.peak[stage], rss)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _rerun(sampler, run):
+    # One script run: stage split, total time/peak memory and what was sent to the browser
+    import profiler
+
+    sampler.reset()
+    started = time.perf_counter()
+    at = run()
+    seconds = time.perf_counter() - started
+    sampler.sample()
+    profile = profiler.last_profile()
+    stages = dict(profile.seconds, other=profile.other_seconds)
+    calls = dict(profile.calls, other=1)
+    charts = at.get("plotly_chart")
+    return {
+        "seconds": seconds,
+        "peak_rss_bytes": max(sampler.peak.values()),
+        "stages": {
+            stage: {"seconds": stages[stage], "calls": calls[stage], "peak_rss_bytes": sampler.peak[stage]}
+            for stage in STAGES
+        },
+        "figures": len(charts),
+        "figure_payload_bytes": sum(len(chart.proto.spec) for chart in charts),
+        "errors": [str(error.value) for error in at.exception],
+    }
+
+
+def page_scenarios(app_dir):
+    """(name, script, view) per benchmarked page; Overview.py once per view."""
+    scenarios = [(f"Overview.py:{view}", "Overview.py", view) for view in OVERVIEW_VIEWS]
+    for script in sorted(glob.glob(os.path.join(app_dir, "pages", "*.py"))):
+        name = os.path.basename(script)
+        if name not in SKIPPED_PAGES:
+            scenarios.append((name, os.path.join("pages", name), None))
+    return scenarios
+
+
+def benchmark_pages(app_dir, timeout=600):
+    """Run every page against the dataset in HOSPITAL_DATA_FILE and return its results.
+
+    Each page is run cold (empty figure cache), rerun unchanged (cached
+    figures), and rerun with the first department selected (a new filter state).
+    """
+    from streamlit.testing.v1 import AppTest
+
+    from charts import figure_cache
+
+    sampler = RssSampler()
+    results = {}
+    try:
+        for name, script, view in page_scenarios(app_dir):
+            # Drop the shared figure cache, so the first run builds every figure
+            figure_cache.clear()
+            at = AppTest.from_file(os.path.join(app_dir, script), default_timeout=timeout)
+            if view is None or view == OVERVIEW_VIEWS[0]:
+                runs = {"cold": _rerun(sampler, at.run)}
+            else:
+                at.run()
+                views = next(box for box in at.sidebar.selectbox if box.label == "Select a page")
+                runs = {"cold": _rerun(sampler, views.select(view).run)}
+            runs["warm"] = _rerun(sampler, at.run)
+            departments = next((box for box in at.sidebar.multiselect if "department" in box.label.lower()), None)
+            if departments is not None and departments.options:
+                runs["filtered"] = _rerun(sampler, departments.select(departments.options[0]).run)
+            results[name] = runs
+    finally:
+        sampler.close()
+    return results
+
+
+def _worker(path, app_dir):
+    # Runs in a fresh process per dataset, so peak RSS isn't carried over between sizes
+    os.environ["HOSPITAL_DATA_FILE"] = path
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    # Imported first so the pages' data path is timed
+    import profiler
+    from data_loader import load_dataset
+
+    started = time.perf_counter()
+    load_dataset(path=path)
+    ingest = {"seconds": time.perf_counter() - started, "peak_rss_bytes": current_rss()}
+    return {"ingest": ingest, "pages": benchmark_pages(app_dir)}
+
+
+def dataset_path(rows, seed, data_dir=DATA_DIR):
+    """Generate (once) and return the CSV of `rows` rows used for benchmarks."""
+    from generator import DatasetSpec, generate
+
+    path = os.path.abspath(os.path.join(data_dir, f"bench-{rows}-{DAYS}d-{seed}.csv"))
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        generate(DatasetSpec(rows, days=DAYS, seed=seed), path)
+    return path
+
+
+def run(sizes=SIZES, seed=0, data_dir=DATA_DIR):
+    """Benchmark every page at each size, one subprocess per size. Returns the results document."""
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for rows in sizes:
+        path = dataset_path(rows, seed, data_dir)
+        print(f"benchmarking {rows:,} rows", file=sys.stderr)
+        done = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", path],
+            cwd=app_dir, capture_output=True, text=True,
+        )
+        if done.returncode:
+            raise RuntimeError(f"benchmark at {rows:,} rows failed:\n{done.stderr}")
+        results[str(rows)] = json.loads(done.stdout.strip().splitlines()[-1])
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "days": DAYS,
+        "seed": seed,
+        "sizes": results,
+    }
+
+
+def _stage_seconds(document):
+    # {(rows, page, run, stage): seconds} over a results document
+    flat = {}
+    for rows, result in document["sizes"].items():
+        flat[(rows, "ingest", "", "load")] = result["ingest"]["seconds"]
+        for page, runs in result["pages"].items():
+            for run_name, measured in runs.items():
+                for stage, values in measured["stages"].items():
+                    flat[(rows, page, run_name, stage)] = values["seconds"]
+    return flat
+
+
+def compare(document, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Stages at least `tolerance` times slower than in `baseline`, as (key, before, after) tuples."""
+    before, after = _stage_seconds(baseline), _stage_seconds(document)
+    return [
+        (key, before[key], after[key]) for key in sorted(after)
+        if key in before and before[key] >= MIN_COMPARED_SECONDS and after[key] > before[key] * tolerance
+    ]
+
+
+def report(document):
+    """Per size and page: rerun times, figure payload and peak memory, as text."""
+    lines = []
+    for rows, result in document["sizes"].items():
+        ingest = result["ingest"]
+        lines.append(f"{int(rows):,} rows (ingest {ingest['seconds']:.2f}s)")
+        for page, runs in result["pages"].items():
+            cells = []
+            for run_name, measured in runs.items():
+                stages = " ".join(f"{stage} {measured['stages'][stage]['seconds']:.3f}" for stage in STAGES)
+                cells.append(f"{run_name} {measured['seconds']:.3f}s [{stages}]")
+            cold = runs["cold"]
+            lines.append(f"  {page}: {'; '.join(cells)}; payload {cold['figure_payload_bytes'] / 1024:.0f}KB, "
+                         f"peak {cold['peak_rss_bytes'] / 2 ** 20:.0f}MB")
+            for run_name, measured in runs.items():
+                for error in measured["errors"]:
+                    lines.append(f"    error ({run_name}): {error}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard pages on generated datasets.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="dataset sizes in rows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="where generated datasets are kept")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file for the results")
+    parser.add_argument("--compare", help="earlier results JSON; exits with status 1 on regressions")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(_worker(args.worker, os.path.dirname(os.path.abspath(__file__)))))
+        return 0
+
+    document = run(args.sizes, args.seed, args.data_dir)
+    with open(args.output, "w") as out:
+        json.dump(document, out, indent=2)
+    print(report(document))
+    print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(document, json.load(baseline))
+        for (rows, page, run_name, stage), before, after in regressions:
+            print(f"REGRESSION {int(rows):,} rows {page} {run_name} {stage}: {before:.3f}s -> {after:.3f}s")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
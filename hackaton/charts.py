@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+import streamlit as st
+
+from data_loader import DATA_FILE, dataset_version
+from timeseries import MAX_POINTS, TICK_FORMATS, fit_frequency, minmax_downsample
+
+# Memory budget for cached figures, measured as their serialized JSON size
+FIGURE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class FigureCache:
+    """LRU cache of built Plotly figures (and the small tables beside them) with a memory cap.
+
+    Figures are stored as built, so a hit skips both the aggregation behind the
+    chart and figure construction. Entries are evicted least recently used
+    first once their total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        # Built outside the lock, so a slow chart doesn't hold up other sessions
+        figure = build()
+        size = _entry_size(figure)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (figure, size)
+                self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return figure
+
+    @property
+    def size(self):
+        return self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def _entry_size(value):
+    # Figures count their serialized JSON size, tables their memory use
+    if value is None:
+        return 0
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return len(pio.to_json(value, validate=False))
+
+
+@st.cache_resource
+def figure_cache():
+    """The figure cache shared by every session in the process."""
+    return FigureCache()
+
+
+def filter_state(start=None, end=None, selections=None, **extra):
+    """Hashable, normalized form of a page's filters, for figure cache keys.
+
+    Selection order doesn't matter and empty selections are dropped, so
+    equivalent widget states share cache entries. `extra` holds any other
+    chart inputs (e.g. a metric list) and is normalized the same way.
+    """
+    def normalize(values):
+        return tuple(sorted(map(str, values)))
+
+    selected = {column: values for column, values in (selections or {}).items() if values}
+    selected.update({name: value for name, value in extra.items() if value})
+    return (
+        None if start is None else pd.Timestamp(start),
+        None if end is None else pd.Timestamp(end),
+        tuple(sorted((name, normalize(values)) for name, values in selected.items())),
+    )
+
+
+def cached_figure(page, chart_id, state, build, path=DATA_FILE):
+    """Return the figure for `chart_id` on `page`, calling `build()` only on a miss.
+
+    `state` comes from `filter_state`. `build` may return None for "nothing to
+    show", which is cached too. The figure is shared between sessions and must
+    not be modified after it is returned.
+    """
+    return figure_cache().get_or_build((page, chart_id, state, dataset_version(path)), build)
+
+
+def cached_frame(page, table_id, state, build, path=DATA_FILE):
+    """Like `cached_figure`, for an aggregated DataFrame a page shows or charts.
+
+    The frame is shared between sessions and must not be modified after it is
+    returned.
+    """
+    return figure_cache().get_or_build((page, table_id, state, dataset_version(path)), build)
+
+
+def date_bar(summary, metric):
+    """Bar chart of `metric` over the dates of a CubeView, bounded in size.
+
+    Numeric metrics show the per-date total, min/max-downsampled to at most
+    MAX_POINTS bars. Categorical columns show row counts per category, bucketed
+    by the finest period that keeps the chart under MAX_POINTS bars per category.
+    """
+    title = f"{metric.replace('_', ' ').title()} by Date"
+    if metric in summary.metrics:
+        daily = minmax_downsample(summary.over_time("D", **{metric: "sum"})[metric])
+        return px.bar(daily.reset_index(), x="daily", y=metric, title=title)
+    freq = fit_frequency(summary.frame.index, MAX_POINTS)
+    counts = summary.counts_over_time(metric, freq)
+    fig = px.bar(counts, x=counts.columns[0], y="rows", color=metric, title=title)
+    fig.update_xaxes(tickformat=TICK_FORMATS[freq])
+    return fig
@@ -0,0 +1,305 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from llm import CANCELLED, TIMED_OUT, StopSignal, StreamStopped
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. You do not respond as 'User' or pretend to be 'User'. "
+    "You only respond once as 'Assistant'."
+)
+
+# Rough token estimate used for budgeting (about 4 characters per English token)
+CHARS_PER_TOKEN = 4
+
+# Default prompt budget for the history, in tokens; Llama 2 has a 4096-token context
+HISTORY_TOKEN_BUDGET = 2048
+
+# Share of the budget the summary of dropped turns may use
+SUMMARY_SHARE = 0.15
+
+# Cached replies expire after this many seconds, and at most this many are kept
+RESPONSE_TTL_SECONDS = 24 * 60 * 60
+RESPONSE_CACHE_ENTRIES = 1000
+
+# How often the page redraws a reply that is still being generated
+REPLY_POLL_SECONDS = 0.25
+
+# A reply is abandoned once it has been generating for this long
+REPLY_TIMEOUT_SECONDS = 120
+
+# Worker threads generating replies, shared by all sessions
+REPLY_WORKERS = 16
+
+# Shown at the end of a reply that is still streaming
+STREAM_CURSOR = "▌"
+
+# Appended to the part of a reply that arrived before it timed out
+REPLY_TIMEOUT_NOTE = "\n\n_(The model took too long, so the reply was cut off here.)_"
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_turn(message):
+    return ("User: " if message["role"] == "user" else "Assistant: ") + message["content"] + "\n\n"
+
+
+def extractive_summary(summary, dropped):
+    """Default summarizer: keep the gist of each dropped user turn, one short line each."""
+    lines = [line for line in summary.splitlines() if line]
+    for text in dropped:
+        if text.startswith("User: "):
+            question = " ".join(text[len("User: "):].split())
+            lines.append("- " + (question[:77] + "..." if len(question) > 80 else question))
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """Rolling window of chat turns that renders prompts within a token budget.
+
+    Turns are formatted and measured once, when they are added, and appended
+    to a cached prompt prefix, so a new turn costs only its own length. When
+    the window goes over `budget`, the oldest turns are dropped and passed to
+    `summarize(summary, dropped_texts) -> summary`; the summary gets
+    SUMMARY_SHARE of the budget and stays at the top of the prompt. Pass
+    ``summarize=None`` to drop old turns without a trace.
+    """
+
+    def __init__(self, budget=HISTORY_TOKEN_BUDGET, summarize=extractive_summary):
+        self.budget = budget
+        self.summarize = summarize
+        self.reset()
+
+    def reset(self):
+        self.turns = deque()
+        self.tokens = 0
+        self.summary = ""
+        self.dropped = 0
+        self._source = None
+        self._seen = 0
+        self._prefix = SYSTEM_PROMPT
+
+    def add(self, message):
+        text = format_turn(message)
+        self.turns.append((text, estimate_tokens(text)))
+        self.tokens += self.turns[-1][1]
+        self._prefix += text
+        self.compact()
+
+    def sync(self, messages):
+        """Add whatever `messages` holds beyond what was already added.
+
+        A different list (e.g. after clearing the chat) or a shorter one resets
+        the memory first.
+        """
+        if messages is not self._source or len(messages) < self._seen:
+            self.reset()
+            self._source = messages
+        for message in messages[self._seen:]:
+            self.add(message)
+        self._seen = len(messages)
+
+    def compact(self, reserve=0):
+        """Drop (and summarize) the oldest turns until the window plus `reserve` fits the budget."""
+        dropped = []
+        # Part of the budget is set aside for the summary
+        window = self.budget - (int(self.budget * SUMMARY_SHARE) if self.summarize is not None else 0)
+        # The newest turn is always kept, even if it alone is over budget
+        while len(self.turns) > 1 and self.tokens + reserve > window:
+            text, tokens = self.turns.popleft()
+            self.tokens -= tokens
+            dropped.append(text)
+        if not dropped:
+            return
+        self.dropped += len(dropped)
+        if self.summarize is not None:
+            summary = self.summarize(self.summary, dropped)
+            # Oldest summary lines go first once the summary outgrows its share
+            limit = int(self.budget * SUMMARY_SHARE) * CHARS_PER_TOKEN
+            self.summary = summary[-limit:].split("\n", 1)[-1] if len(summary) > limit else summary
+        self._prefix = SYSTEM_PROMPT + self._summary_block() + "".join(text for text, _ in self.turns)
+
+    def _summary_block(self):
+        if not self.summary:
+            return ""
+        return f"Earlier in this conversation the user asked:\n{self.summary}\n\n"
+
+    def prompt(self, prompt_input):
+        """The Llama 2 prompt for `prompt_input` on top of the current window."""
+        self.compact(reserve=estimate_tokens(prompt_input))
+        return f"{self._prefix} {prompt_input} Assistant: "
+
+
+class PendingReply:
+    """A reply being generated on a worker thread.
+
+    The page polls `text` and `done`, and calls `expire` once `expired`, so a
+    stalled backend is given up on at the deadline rather than at its next
+    chunk. `cancel` and `expire` set `stop`, which the backend stream also
+    watches: it breaks off a read in progress and frees the worker thread and
+    the backend's slot.
+    """
+
+    def __init__(self, timeout=REPLY_TIMEOUT_SECONDS, stop=None):
+        self.deadline = time.monotonic() + timeout
+        self.stop = stop if stop is not None else StopSignal()
+        self.done = False
+        self.error = None
+        self._parts = []
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    @property
+    def cancelled(self):
+        return self.stop.reason == CANCELLED
+
+    @property
+    def expired(self):
+        return time.monotonic() > self.deadline
+
+    @property
+    def timed_out(self):
+        return self.stop.timed_out
+
+    def cancel(self):
+        self.stop.set(CANCELLED)
+
+    def expire(self):
+        """Give up on the reply; `text` keeps what arrived before the deadline."""
+        self.stop.set(TIMED_OUT)
+
+    def _run(self, chunks):
+        try:
+            for chunk in chunks:
+                if self.stop.is_set():
+                    break
+                if self.expired:
+                    self.expire()
+                    break
+                self._parts.append(chunk)
+        except StreamStopped:
+            pass
+        except Exception as error:
+            self.error = error
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self.done = True
+
+
+_executor = ThreadPoolExecutor(max_workers=REPLY_WORKERS, thread_name_prefix="chat-reply")
+
+
+def submit_reply(chunks, timeout=REPLY_TIMEOUT_SECONDS, stop=None):
+    """Start consuming the reply iterator `chunks` on a worker thread and return its PendingReply.
+
+    Pass the StopSignal given to the backend stream behind `chunks` as `stop`,
+    so cancelling or expiring the reply interrupts the stream too.
+    """
+    pending = PendingReply(timeout, stop)
+    _executor.submit(pending._run, chunks)
+    return pending
+
+
+def normalize_prompt(prompt):
+    # Case, spacing and trailing punctuation don't change the question
+    return " ".join(prompt.lower().split()).rstrip("?!. ")
+
+
+class ResponseCache:
+    """TTL + LRU cache of chatbot replies, optionally persisted to a JSON file.
+
+    Keys come from `key`, which folds in everything that changes the answer:
+    the normalized prompt, the model and its sampling settings, and the
+    dataset version. Replies older than `ttl` seconds count as misses.
+    """
+
+    def __init__(self, path=None, ttl=RESPONSE_TTL_SECONDS, max_entries=RESPONSE_CACHE_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializes writes to `path`, separately from `_lock` so readers never wait on disk
+        self._save_lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    @staticmethod
+    def key(prompt, model, temperature, top_p, max_length, version):
+        # A JSON string, so keys survive the round trip to disk unchanged
+        return json.dumps([normalize_prompt(prompt), model, temperature, top_p, max_length, version], default=str)
+
+    def get(self, key):
+        """The cached reply for `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = (text, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        try:
+            self.save()
+        except (OSError, TypeError, ValueError):
+            # The reply is already cached in memory; a failed write must not fail it
+            logger.exception("could not save the response cache to %s", self.path)
+
+    def cached_stream(self, key, chunks):
+        """Pass `chunks` through and cache the full reply once the stream completes."""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        # Only reached when the stream ran to the end: partial or failed replies aren't cached
+        self.put(key, "".join(parts))
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                entries = dict(self._entries)
+            # Written whole and swapped in, so a crash never leaves half a file behind
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            # A damaged cache file is just an empty cache
+            return
+        now = time.time()
+        # Oldest first, so LRU order is roughly preserved across restarts
+        for key, (text, created) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if now - created <= self.ttl:
+                self._entries[key] = (text, created)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,438 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+# Copy-on-write lets column selections and row slices of the shared dataset be
+# views, and turns any accidental write into a private copy instead of an error
+# on the read-only memory-mapped arrays.
+pd.set_option("mode.copy_on_write", True)
+
+# Default dataset used by the dashboard pages (e.g. a generated extract for benchmarks)
+DATA_FILE = os.getenv("HOSPITAL_DATA_FILE", "fake_healthcare_2.csv")
+
+# Date partition size as a numpy datetime unit ("D" for daily, "M" for monthly).
+# The in-memory index keeps one offset per partition so date lookups only ever
+# touch the partitions in range.
+PARTITION_UNIT = "M"
+
+# Bytes just before the ingested end of a CSV that are hashed to make sure a
+# grown file was only appended to (and not rewritten) before parsing its tail
+TAIL_CHECK_BYTES = 64 * 1024
+
+# Explicit dtype schema so pandas doesn't have to infer types on every load.
+# Columns missing from a given extract are simply ignored by read_csv.
+CATEGORY_COLUMNS = ["departments", "refer_reason", "doctor_id", "day_of_week", "staff_patient_ratio"]
+
+INT_COLUMNS = [
+    "daily_visits", "daily_admissions", "patient_days", "daily_discharge", "wait_time",
+    "daily_revenue", "ctf_daily", "daily_profit", "ctp_daily", "beds_in_use", "total_beds",
+    "daily_readmission", "employee_count", "employee_resign", "equip_count",
+]
+
+FLOAT_COLUMNS = [
+    "admission_rate", "occupancy_rate", "readmission_rate", "bed_turnover", "employee_turnover",
+    "equip_use",
+]
+
+DTYPES = {
+    **{col: "category" for col in CATEGORY_COLUMNS},
+    **{col: "int32" for col in INT_COLUMNS},
+    **{col: "float32" for col in FLOAT_COLUMNS},
+}
+
+
+def _partition_bounds(dates):
+    # (start, stop) row positions of each date partition in a sorted datetime64 array
+    keys = dates.astype(f"datetime64[{PARTITION_UNIT}]")
+    starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    return list(zip([0, *starts], [*starts, len(dates)]))
+
+
+# --- Snapshot -----------------------------------------------------------------
+#
+# The pages read from a snapshot directory next to the source file:
+#
+#   <name>.snapshot/meta.json            generation, row count, column specs, source state
+#   <name>.snapshot/<generation>/*.bin   one raw little-endian array per column
+#
+# Columns are plain fixed-width arrays (categoricals as int32 codes), so they can
+# be memory-mapped without copying and new rows can be appended to the end of
+# each file. A full rebuild writes a new generation and swaps meta.json; the
+# generation it replaced is kept until the rebuild after that, so a session that
+# read the old meta.json just before the swap can still map it.
+
+_ingest_lock = threading.Lock()
+
+# Snapshot metadata pinned per thread by `pin_snapshot`, keyed by source path
+_pinned = threading.local()
+
+# Partition index per snapshot, extended in place when rows are appended
+_partition_indexes = {}
+
+
+def snapshot_path(path):
+    return os.path.splitext(path)[0] + ".snapshot"
+
+
+def _read_meta(snapshot):
+    try:
+        with open(os.path.join(snapshot, "meta.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(snapshot, meta):
+    tmp_path = os.path.join(snapshot, "meta.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(snapshot, "meta.json"))
+
+
+def _tail_hash(path, size):
+    start = max(0, size - TAIL_CHECK_BYTES)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return hashlib.sha1(f.read(size - start)).hexdigest()
+
+
+def _parse_csv(path, start, stop, header=None):
+    # Parse bytes [start, stop) of a CSV and return (rows, bytes consumed up to).
+    # A tail (`header` given) only consumes complete lines, so a row the feed is
+    # still writing is picked up on the next refresh instead of half-parsed.
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    if header is not None:
+        data = data[:data.rfind(b"\n") + 1]
+    if not data.strip():
+        return None, start + len(data)
+    df = pd.read_csv(
+        io.BytesIO(data), dtype=DTYPES, parse_dates=["date"],
+        names=header, header=None if header is not None else "infer",
+    )
+    return df, start + len(data)
+
+
+def _column_specs(df):
+    specs = []
+    for name in df.columns:
+        values = df[name]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            specs.append({"name": name, "dtype": "datetime64[ns]"})
+        elif pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            specs.append({"name": name, "dtype": str(values.dtype)})
+        else:
+            categories = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else []
+            specs.append({"name": name, "dtype": "category", "categories": list(categories)})
+    return specs
+
+
+def _storage_dtype(spec):
+    return np.dtype(np.int32 if spec["dtype"] == "category" else spec["dtype"])
+
+
+def _encode_column(values, spec):
+    # On-disk array for `values`; unseen categories are appended to the spec, so
+    # codes already written stay valid
+    if spec["dtype"] != "category":
+        return np.asarray(values, dtype=spec["dtype"])
+    values = np.asarray(values, dtype=object)
+    categories = pd.Index(spec["categories"], dtype=object)
+    codes = categories.get_indexer(values)
+    unseen = pd.unique(values[(codes == -1) & pd.notna(values)])
+    if len(unseen):
+        spec["categories"] += unseen.tolist()
+        codes = pd.Index(spec["categories"], dtype=object).get_indexer(values)
+    return codes.astype(np.int32)
+
+
+def _append_columns(base, df, meta):
+    for spec in meta["columns"]:
+        data = _encode_column(df[spec["name"]], spec)
+        column_file = os.path.join(base, spec["name"] + ".bin")
+        with open(column_file, "r+b" if os.path.exists(column_file) else "wb") as f:
+            # Drop anything past the committed row count, left over from an interrupted append
+            f.truncate(meta["rows"] * _storage_dtype(spec).itemsize)
+            f.seek(0, os.SEEK_END)
+            data.tofile(f)
+
+
+def _is_parquet(path):
+    # A single Parquet file, or a directory of Parquet shards (see generator.generate_sharded)
+    return path.endswith(".parquet") or os.path.isdir(path)
+
+
+def _parquet_parts(path):
+    # The Parquet files making up the dataset at `path`, in order
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.parquet")))
+    return [path]
+
+
+def _source_stat(path):
+    # (size, mtime_ns) of the source; a shard directory counts as its parts' total size and newest part
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    stats = [os.stat(part) for part in _parquet_parts(path)]
+    return sum(stat.st_size for stat in stats), max((stat.st_mtime_ns for stat in stats), default=0)
+
+
+def build_snapshot(path=DATA_FILE):
+    """Rebuild the snapshot for `path` from scratch and return its metadata."""
+    snapshot = snapshot_path(path)
+    size, mtime_ns = _source_stat(path)
+    if _is_parquet(path):
+        df = pa.concat_tables([pq.read_table(part) for part in _parquet_parts(path)]).to_pandas()
+        source = {"size": size, "mtime_ns": mtime_ns}
+    else:
+        df, size = _parse_csv(path, 0, size)
+        source = {
+            "size": size, "mtime_ns": mtime_ns, "tail_hash": _tail_hash(path, size),
+            "header": df.columns.tolist(),
+        }
+    # Date lookups rely on binary search, so the snapshot is always sorted by date
+    df = df.sort_values("date", kind="stable")
+    meta = {"generation": uuid.uuid4().hex, "rows": 0, "columns": _column_specs(df), "source": source}
+    base = os.path.join(snapshot, meta["generation"])
+    os.makedirs(base)
+    _append_columns(base, df, meta)
+    meta["rows"] = len(df)
+    previous = _read_meta(snapshot)
+    _write_meta(snapshot, meta)
+    _remove_generations(snapshot, meta, previous)
+    return meta
+
+
+def _remove_generations(snapshot, meta, previous):
+    # Everything but the new generation and the one it just replaced. Open frames
+    # keep their mappings; on POSIX the old files go away once unmapped.
+    keep = {meta["generation"], previous["generation"] if previous is not None else None}
+    for name in os.listdir(snapshot):
+        if name not in keep and os.path.isdir(os.path.join(snapshot, name)):
+            shutil.rmtree(os.path.join(snapshot, name), ignore_errors=True)
+
+
+def _merge_rows(snapshot, meta, df):
+    # Rows dated before the end of the snapshot: write a new generation with the
+    # (sorted) tail merged into place. Still only a memory copy of the existing
+    # columns; nothing already ingested is parsed again.
+    base = os.path.join(snapshot, meta["generation"])
+    rows = meta["rows"]
+    dates = _map_column(base, meta["columns"][_column_position(meta, "date")], rows)
+    positions = np.searchsorted(dates, df["date"].to_numpy(), side="right")
+    merged = dict(meta, generation=uuid.uuid4().hex, rows=rows + len(df))
+    new_base = os.path.join(snapshot, merged["generation"])
+    os.makedirs(new_base)
+    for spec in merged["columns"]:
+        data = np.insert(_map_column(base, spec, rows), positions, _encode_column(df[spec["name"]], spec))
+        data.tofile(os.path.join(new_base, spec["name"] + ".bin"))
+    return merged
+
+
+def _column_position(meta, name):
+    return next(i for i, spec in enumerate(meta["columns"]) if spec["name"] == name)
+
+
+def _append_csv_tail(path, snapshot, meta):
+    # Parse only the bytes added since the last ingest and add them to the snapshot
+    source = meta["source"]
+    stat = os.stat(path)
+    df, size = _parse_csv(path, source["size"], stat.st_size, header=source["header"])
+    if df is None:
+        return meta
+    df = df.sort_values("date", kind="stable")
+    base = os.path.join(snapshot, meta["generation"])
+    last_date = None
+    if meta["rows"]:
+        last_date = np.fromfile(
+            os.path.join(base, "date.bin"), dtype="datetime64[ns]", count=1, offset=(meta["rows"] - 1) * 8
+        )[0]
+    previous = dict(meta)
+    if last_date is None or df["date"].iloc[0] >= last_date:
+        # The common case for a live feed: append to the end of every column file
+        _append_columns(base, df, meta)
+        meta["rows"] += len(df)
+    else:
+        meta = _merge_rows(snapshot, meta, df)
+    meta["source"] = dict(source, size=size, mtime_ns=stat.st_mtime_ns, tail_hash=_tail_hash(path, size))
+    _write_meta(snapshot, meta)
+    if meta["generation"] != previous["generation"]:
+        _remove_generations(snapshot, meta, previous)
+    return meta
+
+
+def ensure_snapshot(path=DATA_FILE):
+    """Bring the snapshot for `path` up to date and return its metadata.
+
+    A CSV that has only grown gets just its new tail parsed and added; a new or
+    rewritten file triggers a full rebuild.
+    """
+    snapshot = snapshot_path(path)
+    with _ingest_lock:
+        meta = _read_meta(snapshot)
+        size, mtime_ns = _source_stat(path)
+        if meta is not None:
+            source = meta["source"]
+            if (size, mtime_ns) == (source["size"], source["mtime_ns"]):
+                return meta
+            if (
+                "header" in source
+                and size > source["size"]
+                and _tail_hash(path, source["size"]) == source["tail_hash"]
+            ):
+                return _append_csv_tail(path, snapshot, meta)
+        return build_snapshot(path)
+
+
+def _map_column(base, spec, rows):
+    dtype = _storage_dtype(spec)
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    # Read-only view straight onto the file; pages are loaded lazily by the OS
+    return np.asarray(np.memmap(os.path.join(base, spec["name"] + ".bin"), dtype=dtype, mode="r", shape=(rows,)))
+
+
+@st.cache_resource(show_spinner="Loading dataset...", max_entries=4)
+def _open_snapshot(snapshot, generation, rows, _columns):
+    # Keyed on (generation, rows): an append or rebuild maps a new frame, which only
+    # costs a few mmap calls. The frame is shared by every session in the process
+    # and its arrays point straight into the mapped files.
+    base = os.path.join(snapshot, generation)
+    index, columns = None, {}
+    for spec in _columns:
+        values = _map_column(base, spec, rows)
+        if spec["name"] == "date":
+            index = pd.DatetimeIndex(values, name="date", copy=False)
+        elif spec["dtype"] == "category":
+            columns[spec["name"]] = pd.Categorical.from_codes(values, categories=spec["categories"], validate=False)
+        else:
+            columns[spec["name"]] = values
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def pin_snapshot(path=DATA_FILE):
+    """Bring the snapshot for `path` up to date and serve this thread's reads from it until the next pin.
+
+    Pages call this once at the top of every rerun. Every later read of the
+    snapshot in the run (the page frame, the filter cascade, `dataset_version`
+    and so figure cache keys) then sees the same generation and row count, even
+    if the feed appends mid-run. Returns the pinned (generation, rows) version.
+
+    The shared pre-aggregates from `incremental.shared_loader` (rollup cube,
+    doctor index, rolling engine, leaderboard) are not pinned: they are at
+    least as new as the pin, and may already hold rows another session's rerun
+    appended after it. Figures drawn from them can be up to that much newer
+    than their cache key.
+    """
+    meta = ensure_snapshot(path)
+    _pinned.metas = dict(getattr(_pinned, "metas", {}), **{path: meta})
+    # Mapped right away, so the generation can't be removed before this run opens it
+    _open_snapshot(snapshot_path(path), meta["generation"], meta["rows"], meta["columns"])
+    return meta["generation"], meta["rows"]
+
+
+def _current_meta(path):
+    # The pinned snapshot for this thread when there is one, else the latest
+    pinned = getattr(_pinned, "metas", {}).get(path)
+    return pinned if pinned is not None else ensure_snapshot(path)
+
+
+def _shared_frame(path):
+    meta = _current_meta(path)
+    snapshot = snapshot_path(path)
+    return snapshot, meta, _open_snapshot(snapshot, meta["generation"], meta["rows"], meta["columns"])
+
+
+def _partition_index(snapshot, meta, dates):
+    # Start date of every partition and its first row; the final offset is the row count
+    generation, rows = meta["generation"], meta["rows"]
+    cached = _partition_indexes.get(snapshot)
+    if cached is not None and cached[0] == generation and cached[1] == rows:
+        return cached[2], cached[3]
+    if cached is not None and cached[0] == generation and cached[1] > rows:
+        # A run pinned to fewer rows than another session has since indexed: cut the index down
+        keys, offsets = cached[2], cached[3][:-1]
+        kept = offsets < rows
+        return keys[kept], np.append(offsets[kept], rows)
+    if cached is not None and cached[0] == generation and cached[1] < rows:
+        # Rows were appended: only scan the new tail, continuing the last partition if needed
+        done, keys, offsets = cached[1], cached[2], cached[3][:-1]
+    else:
+        done, keys, offsets = 0, np.array([], dtype=f"datetime64[{PARTITION_UNIT}]"), np.array([], dtype=np.int64)
+    starts = np.array([done + start for start, _ in _partition_bounds(dates[done:rows])], dtype=np.int64)
+    new_keys = dates[starts].astype(f"datetime64[{PARTITION_UNIT}]")
+    if len(keys) and len(new_keys) and new_keys[0] == keys[-1]:
+        starts, new_keys = starts[1:], new_keys[1:]
+    keys = np.concatenate([keys, new_keys])
+    offsets = np.concatenate([offsets, starts, [rows]])
+    _partition_indexes[snapshot] = (generation, rows, keys, offsets)
+    return keys, offsets
+
+
+def _locate(dates, keys, offsets, when, side):
+    # Binary search over the (few) partition keys, then only inside the one partition holding `when`
+    when = pd.Timestamp(when).to_datetime64()
+    part = np.searchsorted(keys, when.astype(keys.dtype), side="right") - 1
+    if part < 0:
+        return 0
+    lo, hi = offsets[part], offsets[part + 1]
+    return int(lo + np.searchsorted(dates[lo:hi], when, side=side))
+
+
+def date_slice(start=None, end=None, path=DATA_FILE):
+    """Return the rows dated within [start, end] as a positional slice of the dataset.
+
+    O(log n) and independent of how many rows fall outside the range.
+    """
+    snapshot, meta, df = _shared_frame(path)
+    dates = df.index.to_numpy()
+    keys, offsets = _partition_index(snapshot, meta, dates)
+    i = 0 if start is None else _locate(dates, keys, offsets, start, "left")
+    j = len(dates) if end is None else _locate(dates, keys, offsets, end, "right")
+    return slice(i, max(i, j))
+
+
+def date_bounds(path=DATA_FILE):
+    """Return the (min, max) dates in the dataset without scanning it."""
+    index = _shared_frame(path)[2].index
+    if not len(index):
+        return pd.NaT, pd.NaT
+    return index[0], index[-1]
+
+
+def dataset_version(path=DATA_FILE):
+    """Return a (generation, rows) token for cache keys.
+
+    `rows` grows when new rows are appended; `generation` changes on a full rebuild.
+    """
+    meta = _current_meta(path)
+    return meta["generation"], meta["rows"]
+
+
+def load_dataset(columns=None, start=None, end=None, path=DATA_FILE):
+    """Return the dataset as a date-indexed, typed DataFrame.
+
+    The data is served from a memory-mapped snapshot shared by all sessions and
+    pages. Selecting `columns` (all of them when None) and the rows between
+    `start` and `end` returns a view, not a copy; callers must treat the result
+    as read-only and use `assign`/masks instead of adding columns in place.
+    """
+    df = _shared_frame(path)[2]
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns and col != "date"]]
+    if start is not None or end is not None:
+        df = df.iloc[date_slice(start, end, path)]
+    return df
@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import DATA_FILE
+from incremental import grow_codes, shared_loader
+from leaderboard import top_n
+
+# Per-doctor metrics kept in the index; wait_time is reported as a mean, the rest as totals
+DOCTOR_METRICS = ["daily_visits", "daily_admissions", "daily_readmission", "wait_time", "daily_revenue"]
+MEAN_METRICS = ["wait_time"]
+
+# Sidebar filters the shared index can answer; any other selection needs the filtered rows
+INDEX_FILTERS = ["departments", "doctor_id"]
+
+# Bits of the (doctor, day) sort key that hold the day; days since 1970 fit until the year 4840
+_DAY_BITS = 20
+
+
+class _IndexState:
+    """One version of a DoctorIndex's arrays.
+
+    `extend` builds a new one and publishes it with a single assignment, so a
+    session reading the shared index never pairs new doctors with old offsets.
+    """
+
+    def __init__(self, doctors, departments, rows, order, offsets, keys, running, totals):
+        self.doctors = doctors
+        self.departments = departments
+        self.rows = rows
+        self.order = order
+        self.offsets = offsets
+        self.keys = keys
+        # Per metric, in `order`: the running sum within the row's doctor, up to and including the row
+        self.running = running
+        self.totals = totals
+
+
+class DoctorIndex:
+    """Row positions and running aggregates per doctor_id.
+
+    Rows are kept grouped by doctor and, within a doctor, in date order (a CSR
+    layout: `offsets[code]` to `offsets[code + 1]` in `order`). Running sums of
+    each metric within each doctor's segment answer any doctor's totals over
+    any date range with two binary searches, so KPIs, rankings and comparisons
+    cost O(selected doctors x log rows) however many rows the dataset has.
+    """
+
+    def __init__(self, df):
+        self.metrics = [metric for metric in DOCTOR_METRICS if metric in df.columns]
+        doctors = pd.Index([], dtype=object)
+        self._state = _IndexState(
+            doctors=doctors,
+            departments=pd.Series([], dtype=object),
+            rows=0,
+            order=np.array([], dtype=np.int64),
+            offsets=np.zeros(1, dtype=np.int64),
+            keys=np.array([], dtype=np.int64),
+            running={metric: np.array([]) for metric in self.metrics},
+            totals=pd.DataFrame(0.0, index=doctors, columns=["rows", *self.metrics]),
+        )
+        self.extend(df)
+
+    # Readers that need more than one of these take `self._state` once instead
+    @property
+    def doctors(self):
+        return self._state.doctors
+
+    @property
+    def departments(self):
+        return self._state.departments
+
+    @property
+    def rows(self):
+        return self._state.rows
+
+    @property
+    def order(self):
+        return self._state.order
+
+    @property
+    def offsets(self):
+        return self._state.offsets
+
+    @property
+    def totals(self):
+        return self._state.totals
+
+    def extend(self, df):
+        """Index rows appended after the ones already indexed (`df` holds only the new rows, in date order)."""
+        if df.empty:
+            return
+        state = self._state
+        doctors, codes = grow_codes(state.doctors, df["doctor_id"])
+        rows = state.rows + len(df)
+        positions = np.arange(state.rows, rows, dtype=np.int64)
+        known = codes >= 0
+        df, codes, positions = df[known], codes[known], positions[known]
+        days = df.index.to_numpy().astype("datetime64[D]").astype(np.int64)
+        keys = (codes.astype(np.int64) << _DAY_BITS) | days
+        # Only the new rows are sorted
+        sorted_new = np.argsort(keys, kind="stable")
+        keys, doctor = keys[sorted_new], codes[sorted_new]
+
+        # New rows are dated on or after the indexed ones, so each doctor's go at the
+        # end of its segment; new doctors' segments go after everything else
+        counts = np.zeros(len(doctors), dtype=np.int64)
+        counts[:len(state.offsets) - 1] = np.diff(state.offsets)
+        at = np.cumsum(counts)[doctor]
+        # Each doctor's first new row, where its running sums pick up from its last indexed row
+        starts = np.diff(doctor, prepend=-1) != 0
+        group, first = np.cumsum(starts) - 1, np.flatnonzero(starts)
+        previous = np.where(counts[doctor[first]] > 0, at[first] - 1, -1)
+        running = {}
+        for metric in self.metrics:
+            values = df[metric].to_numpy(dtype=np.float64)[sorted_new]
+            summed = np.cumsum(values)
+            # np.r_ appends a 0 for doctors with no rows yet (index -1)
+            base = np.r_[state.running[metric], 0.0][previous]
+            running[metric] = np.insert(state.running[metric], at, summed - (summed[first] - values[first] - base)[group])
+
+        # Running per-doctor totals over the whole dataset, updated with only the new rows
+        added = np.bincount(codes, minlength=len(doctors))
+        totals = state.totals.reindex(doctors, fill_value=0.0)
+        totals["rows"] += added
+        for metric in self.metrics:
+            totals[metric] += np.bincount(codes, weights=df[metric].to_numpy(dtype=np.float64),
+                                          minlength=len(doctors))
+        departments = state.departments
+        if "departments" in df.columns:
+            # Each doctor's department, as first seen
+            seen = pd.Series(df["departments"].to_numpy(), index=codes)
+            seen = seen[~seen.index.duplicated()]
+            departments = departments.reindex(range(len(doctors)))
+            departments = departments.fillna(seen.reindex(departments.index))
+
+        self._state = _IndexState(
+            doctors=doctors,
+            departments=departments,
+            rows=rows,
+            # A linear merge of the new rows into place, O(rows) copying but no re-sort of the history
+            order=np.insert(state.order, at, positions[sorted_new]),
+            offsets=np.r_[0, np.cumsum(counts + added)],
+            keys=np.insert(state.keys, at, keys),
+            running=running,
+            totals=totals,
+        )
+
+    def positions(self, doctor):
+        """Dataset row positions of `doctor`'s rows, in date order."""
+        state = self._state
+        code = state.doctors.get_indexer([doctor])[0]
+        if code < 0:
+            return np.array([], dtype=np.int64)
+        return state.order[state.offsets[code]:state.offsets[code + 1]]
+
+    def doctors_in(self, departments):
+        """Doctors whose rows are in any of `departments`."""
+        state = self._state
+        codes = np.flatnonzero(state.departments.isin(list(departments)).to_numpy())
+        return state.doctors[codes].tolist()
+
+    def summary(self, doctors=None, start=None, end=None):
+        """Per-doctor rows and metrics over [start, end], one row per doctor (all doctors when None).
+
+        Totals for the whole dataset come straight from the running totals;
+        date ranges take two binary searches per doctor.
+        """
+        state = self._state
+        doctors = state.doctors if doctors is None else pd.Index(list(doctors))
+        codes = state.doctors.get_indexer(doctors)
+        known = codes >= 0
+        doctors, codes = doctors[known], codes[known]
+        if start is None and end is None:
+            result = state.totals.iloc[codes].copy()
+        else:
+            first = pd.Timestamp(start or "1970-01-01").to_datetime64().astype("datetime64[D]").astype(np.int64)
+            last = (pd.Timestamp(end).to_datetime64().astype("datetime64[D]").astype(np.int64)
+                    if end is not None else (1 << _DAY_BITS) - 1)
+            base = codes.astype(np.int64) << _DAY_BITS
+            lo = np.searchsorted(state.keys, base | max(first, 0), side="left")
+            hi = np.searchsorted(state.keys, base | min(last, (1 << _DAY_BITS) - 1), side="right")
+            result = pd.DataFrame({"rows": (hi - lo).astype(np.float64)}, index=doctors)
+            # Running sums restart at each doctor's segment, so a range is its last
+            # running sum minus the one just before it (nothing before the segment start)
+            matched, before = hi > lo, lo > state.offsets[codes]
+            for metric in self.metrics:
+                running = np.r_[state.running[metric], 0.0]
+                result[metric] = np.where(matched, running[hi - 1] - np.where(before, running[lo - 1], 0.0), 0.0)
+        result.index = pd.Index(doctors, name="doctor_id")
+        for metric in MEAN_METRICS:
+            if metric in result:
+                result[metric] = result[metric] / result["rows"].where(result["rows"] > 0)
+        result["rows"] = result["rows"].astype(np.int64)
+        return result
+
+    def rank(self, metric, n=10, ascending=False, doctors=None, start=None, end=None):
+        """The `n` doctors with the highest (lowest with `ascending`) `metric` over [start, end]."""
+        summary = self.summary(doctors, start, end)
+        summary = summary[summary["rows"] > 0]
+        return summary.loc[top_n(summary[metric], n, ascending).index]
+
+
+# load_doctor_index(path=DATA_FILE): the doctor index for the dataset at `path`, kept current as rows are appended
+load_doctor_index = shared_loader(DoctorIndex, columns=["doctor_id", "departments", *DOCTOR_METRICS],
+                                  show_spinner="Indexing doctors...")
+
+
+def doctor_index(rows, selections=None, path=DATA_FILE):
+    """Return a doctor index for the current page filters.
+
+    Served from the shared index when only departments and doctors are
+    selected; otherwise (e.g. a refer_reason filter) the already filtered
+    `rows` are indexed instead, like `rollup.summarize` does for the cube.
+    """
+    selections = {column: values for column, values in (selections or {}).items() if values}
+    if all(column in INDEX_FILTERS for column in selections):
+        return load_doctor_index(path)
+    return DoctorIndex(rows)
+
+
+def selected_doctors(index, selections):
+    """Doctors matching the department and doctor selections, or None when neither is set."""
+    doctors = index.doctors_in(selections["departments"]) if selections.get("departments") else None
+    if selections.get("doctor_id"):
+        picked = selections["doctor_id"]
+        doctors = picked if doctors is None else [doctor for doctor in picked if doctor in set(doctors)]
+    return doctors
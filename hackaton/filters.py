@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from data_loader import DATA_FILE, dataset_version, date_slice, load_dataset
+
+
+class FilterEngine:
+    """Mask-based filtering over a date-sorted frame (the shared dataset by default).
+
+    Each filter column is encoded once as integer codes plus labels. A selection
+    is then a lookup-table gather over the codes of the selected date range, and
+    all selections are combined into a single boolean mask; no intermediate
+    frames are built.
+    """
+
+    def __init__(self, df, path=None):
+        # `path` is set when `df` is the whole dataset, so its partition index can be used
+        self.df = df
+        self.path = path
+        self._encoded = {}
+
+    def encode(self, column):
+        # (codes, labels) for `column`, computed on first use and kept for the process
+        if column not in self._encoded:
+            values = self.df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                codes, labels = values.cat.codes.to_numpy(), values.cat.categories
+            else:
+                codes, labels = pd.factorize(values, sort=True)
+            self._encoded[column] = (codes, pd.Index(labels))
+        return self._encoded[column]
+
+    def date_slice(self, start=None, end=None):
+        if self.path is not None:
+            return date_slice(start, end, self.path)
+        # Any other frame (e.g. a rollup) is just binary-searched on its own sorted index
+        index = self.df.index
+        i = 0 if start is None else index.searchsorted(pd.Timestamp(start), side="left")
+        j = len(index) if end is None else index.searchsorted(pd.Timestamp(end), side="right")
+        return slice(i, max(i, j))
+
+    def cascade(self, start=None, end=None):
+        return FilterCascade(self, self.date_slice(start, end))
+
+
+class FilterCascade:
+    """One run of the sidebar cascade: each `select` narrows the options of the next widget."""
+
+    def __init__(self, engine, rows):
+        self.engine = engine
+        self.rows = rows
+        # None means "every row in the date range"; empty selections never allocate a mask
+        self.mask = None
+
+    def _codes(self, column):
+        codes, labels = self.engine.encode(column)
+        return codes[self.rows], labels
+
+    def options(self, column):
+        """Values of `column` present in the rows matched by the selections so far."""
+        codes, labels = self._codes(column)
+        if self.mask is not None:
+            codes = codes[self.mask]
+        present = np.bincount(codes[codes >= 0], minlength=len(labels)) > 0
+        return labels[present].tolist()
+
+    def select(self, column, values):
+        """Restrict the cascade to rows whose `column` is in `values` (no-op when empty)."""
+        if not values:
+            return self
+        codes, labels = self._codes(column)
+        # One extra False slot so missing values (code -1) never match
+        lookup = np.zeros(len(labels) + 1, dtype=bool)
+        positions = labels.get_indexer(list(values))
+        lookup[positions[positions >= 0]] = True
+        matched = lookup[codes]
+        if self.mask is None:
+            self.mask = matched
+        else:
+            self.mask &= matched
+        return self
+
+    def frame(self):
+        """Filtered rows of the engine's own frame."""
+        return self.apply(self.engine.df.iloc[self.rows])
+
+    def apply(self, df):
+        """Filter the date-sliced page frame `df` with the combined mask."""
+        if len(df) != self.rows.stop - self.rows.start:
+            raise ValueError("frame does not match the cascade's date range")
+        if self.mask is None:
+            return df
+        return df[self.mask]
+
+
+@st.cache_resource(max_entries=4)
+def _build_engine(path, version):
+    # `version` is only part of the cache key: a new dataset gets a fresh engine
+    return FilterEngine(load_dataset(path=path), path)
+
+
+def filter_cascade(start=None, end=None, path=DATA_FILE):
+    """Start a filter cascade over the rows between `start` and `end`."""
+    return _build_engine(path, dataset_version(path)).cascade(start, end)
+
+
+def sidebar_filters(df, start, end, filters, path=DATA_FILE):
+    """Render the sidebar multiselect cascade and return (filtered frame, selections).
+
+    `df` is the page frame for the [start, end] date range and `filters` is a
+    list of (column, label) pairs, in the order the widgets should appear.
+    """
+    cascade = filter_cascade(start, end, path)
+    selections = {}
+    for column, label in filters:
+        selections[column] = st.sidebar.multiselect(label, cascade.options(column))
+        cascade.select(column, selections[column])
+    return cascade.apply(df), selections
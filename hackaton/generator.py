@@ -0,0 +1,312 @@
+"""Synthetic hospital dataset generator for benchmark-scale extracts.
+
+Produces the same columns and value ranges as ``fake_healthcare.csv`` (see
+healthcare.ipynb) for any number of rows, streaming the output chunk by chunk:
+
+    python generator.py big.parquet --rows 10000000 --days 730 --departments 23 --seed 7
+
+An output path without an extension is written as a directory of Parquet
+shards, generated in parallel, that together form one dataset:
+
+    python generator.py big --rows 100000000 --days 3650 --workers 8
+
+The output only depends on the arguments, never on memory, timing or the
+number of workers.
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_loader import FLOAT_COLUMNS, INT_COLUMNS
+
+# Rows generated (and held in memory) at a time. Each chunk has its own random
+# stream seeded from (seed, chunk number), so changing this changes the data.
+CHUNK_ROWS = 250_000
+
+# Chunks per shard of a sharded dataset. Shards are contiguous runs of chunks,
+# so each covers its own date range, and they are fixed by the row count
+# alone: the worker count only decides how many are written at once.
+SHARD_CHUNKS = 4
+
+# Column order of the notebook's extract
+COLUMNS = [
+    "date", "departments", "daily_visits", "daily_admissions", "admission_rate", "patient_days",
+    "daily_discharge", "wait_time", "daily_revenue", "ctf_daily", "daily_profit", "ctp_daily",
+    "beds_in_use", "total_beds", "occupancy_rate", "daily_readmission", "readmission_rate",
+    "bed_turnover", "employee_count", "employee_resign", "employee_turnover", "equip_count",
+    "equip_use", "staff_patient_ratio", "refer_reason", "doctor_id", "day_of_week",
+]
+
+_WARD = [
+    "daily_visits", "daily_admissions", "admission_rate", "patient_days", "daily_discharge",
+    "wait_time", "beds_in_use", "total_beds", "occupancy_rate", "daily_readmission",
+    "readmission_rate", "bed_turnover", "employee_count", "employee_resign", "employee_turnover",
+    "equip_count", "equip_use", "staff_patient_ratio", "refer_reason",
+]
+_SERVICE = ["daily_visits", "daily_revenue", "daily_profit", "equip_count", "equip_use", "staff_patient_ratio"]
+_THERAPY = [
+    "daily_visits", "admission_rate", "daily_discharge", "daily_revenue", "daily_profit", "beds_in_use",
+    "total_beds", "occupancy_rate", "employee_count", "employee_resign", "employee_turnover", "equip_count",
+    "equip_use", "staff_patient_ratio",
+]
+_OFFICE = [
+    "daily_visits", "daily_revenue", "daily_profit", "employee_count", "employee_resign", "employee_turnover",
+    "staff_patient_ratio",
+]
+
+# Fields that apply to each department (from the notebook); every other field is zero
+DEPARTMENT_FIELDS = {
+    "emergency": [f for f in _WARD if f not in ("patient_days", "daily_readmission", "readmission_rate", "bed_turnover")],
+    "internal_med": _WARD,
+    "surgery": [f for f in _WARD if f not in ("daily_visits", "wait_time")] + ["daily_revenue", "daily_profit"],
+    "pediatric": _WARD,
+    "obgyn": _WARD,
+    "cardio": _WARD,
+    "orthopedic": [f for f in _WARD if f != "wait_time"],
+    "neurology": [f for f in _WARD if f != "wait_time"],
+    "oncology": _WARD,
+    "radiology": _SERVICE,
+    "pathology": _SERVICE,
+    "anesthesiology": _SERVICE,
+    "icu": _WARD,
+    "psychiatry": _WARD,
+    "physical_therapy": _THERAPY,
+    "resp_therapy": _THERAPY,
+    "nutrition_diet": _OFFICE,
+    "pharmacy": _SERVICE,
+    "laboratory": _SERVICE,
+    "infection_control": [
+        "daily_visits", "admission_rate", "daily_discharge", "daily_readmission", "readmission_rate",
+        "occupancy_rate", "staff_patient_ratio",
+    ],
+    "medical_records": _OFFICE,
+    "admin": _OFFICE,
+    "security": ["employee_count", "employee_resign", "employee_turnover"],
+}
+
+REFER_REASONS = [
+    "Accident", "Chronic Illness", "Elective Procedure", "Child Health", "Prenatal", "Cardiac Issues",
+    "Joint Issues", "Nervous System", "Cancer", "Imaging", "Lab Tests", "Pre/Post Surgery", "Critical Care",
+    "Mental Health", "Rehabilitation", "Breathing Disorders",
+]
+
+# Staff to patient ratios 1:1 to 1:4; "0" marks departments without one, as in the notebook
+STAFF_RATIOS = ["0", "1:1", "1:2", "1:3", "1:4"]
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Fields the department mask applies to, in mask column order
+MASKED = [column for column in COLUMNS if column not in ("date", "departments", "doctor_id", "day_of_week")]
+
+
+class DatasetSpec:
+    """What to generate: `rows` rows over `days` days from `start` across `departments` departments.
+
+    Rows cycle through the departments and are spread evenly over the dates,
+    so the output is sorted by date. Departments past the 23 in the notebook
+    reuse their fields under numbered names ("emergency_2", ...).
+    """
+
+    def __init__(self, rows, start="2024-01-01", days=100, departments=len(DEPARTMENT_FIELDS),
+                 doctors_per_department=1, seed=0):
+        if rows < 0 or days < 1 or departments < 1 or doctors_per_department < 1:
+            raise ValueError("rows must be >= 0 and days, departments and doctors_per_department >= 1")
+        self.rows = rows
+        self.start = np.datetime64(pd.Timestamp(start).date(), "D")
+        self.days = days
+        self.doctors_per_department = doctors_per_department
+        self.seed = seed
+
+        base = list(DEPARTMENT_FIELDS)
+        self.departments = [
+            base[i % len(base)] + (f"_{i // len(base) + 1}" if i >= len(base) else "") for i in range(departments)
+        ]
+        # One row of the mask per department: which of the MASKED fields apply to it
+        self.mask = np.array(
+            [[field in DEPARTMENT_FIELDS[base[i % len(base)]] for field in MASKED] for i in range(departments)]
+        )
+        # Doctors are numbered by department name, as the notebook's groupby().ngroup() does
+        rank = np.empty(departments, dtype=np.int64)
+        rank[np.argsort(self.departments, kind="stable")] = np.arange(departments)
+        self.doctor_ids = [
+            f"{name[:3].upper()}{rank[i] * doctors_per_department + k + 1}"
+            for i, name in enumerate(self.departments) for k in range(doctors_per_department)
+        ]
+
+    @property
+    def chunks(self):
+        # At least one, so an empty spec still writes a file with the columns (a CSV header, a Parquet schema)
+        return max(1, -(-self.rows // CHUNK_ROWS))
+
+    @property
+    def shards(self):
+        return -(-self.chunks // SHARD_CHUNKS)
+
+    def chunk(self, number):
+        """The rows of chunk `number` as a DataFrame; the same call always gives the same rows."""
+        first = number * CHUNK_ROWS
+        stop = min(self.rows, first + CHUNK_ROWS)
+        return self._frame(np.arange(first, stop, dtype=np.int64), np.random.default_rng([self.seed, number]))
+
+    def _frame(self, positions, rng):
+        n = len(positions)
+        department = positions % len(self.departments)
+        dates = self.start + (positions * self.days // max(self.rows, 1)).astype("timedelta64[D]")
+
+        daily_visits = rng.integers(5, 50, n)
+        total_beds = rng.integers(10, 80, n)
+        beds_in_use = np.minimum(total_beds, rng.integers(5, 70, n))
+        daily_discharge = np.minimum(total_beds, rng.integers(1, 40, n))
+        daily_admissions = np.minimum(daily_visits, np.maximum(0, total_beds - beds_in_use - daily_discharge))
+        ctf_daily = rng.integers(2, 20, n)
+        daily_profit = rng.integers(1000, 20000, n)
+        values = {
+            "daily_visits": daily_visits,
+            "daily_admissions": daily_admissions,
+            "admission_rate": np.round(daily_admissions / daily_visits, 2),
+            "patient_days": rng.integers(10, 150, n),
+            "daily_discharge": daily_discharge,
+            "wait_time": rng.integers(5, 60, n),
+            "daily_revenue": daily_profit + ctf_daily,
+            "ctf_daily": ctf_daily,
+            "daily_profit": daily_profit,
+            "ctp_daily": rng.integers(3, 25, n),
+            "beds_in_use": beds_in_use,
+            "total_beds": total_beds,
+            "occupancy_rate": np.round(beds_in_use / total_beds, 2),
+            "daily_readmission": rng.integers(0, 5, n),
+            "readmission_rate": np.round(rng.uniform(0.0, 0.2, n), 2),
+            "bed_turnover": np.round(daily_admissions / total_beds, 1),
+            "employee_count": rng.integers(10, 20, n),
+            "employee_resign": rng.integers(0, 2, n),
+            "equip_count": rng.integers(10, 60, n),
+            "equip_use": np.round(rng.uniform(0.5, 1.0, n), 1),
+            # Category codes; 0 is the "0" placeholder of non-applicable rows
+            "staff_patient_ratio": rng.integers(1, len(STAFF_RATIOS), n),
+            "refer_reason": rng.integers(1, len(REFER_REASONS) + 1, n),
+        }
+        values["employee_turnover"] = np.zeros(n)
+
+        # Zero every field that doesn't apply to the row's department in one pass
+        applies = self.mask[department]
+        for j, field in enumerate(MASKED):
+            values[field] = values[field] * applies[:, j]
+        # Derived after masking, like the notebook (0 where there are no employees)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            turnover = values["employee_resign"] / values["employee_count"]
+        values["employee_turnover"] = np.round(np.nan_to_num(turnover), 2)
+
+        doctor = department * self.doctors_per_department + rng.integers(0, self.doctors_per_department, n)
+        frame = {
+            "date": dates.astype("datetime64[ns]"),
+            "departments": pd.Categorical.from_codes(department, self.departments),
+            **{column: values[column].astype(np.int32) for column in INT_COLUMNS},
+            **{column: values[column].astype(np.float32) for column in FLOAT_COLUMNS},
+            "staff_patient_ratio": pd.Categorical.from_codes(values["staff_patient_ratio"], STAFF_RATIOS),
+            "refer_reason": pd.Categorical.from_codes(values["refer_reason"], ["0", *REFER_REASONS]),
+            "doctor_id": pd.Categorical.from_codes(doctor, self.doctor_ids),
+            "day_of_week": pd.Categorical.from_codes((dates.astype(np.int64) + 3) % 7, DAY_NAMES),
+        }
+        return pd.DataFrame(frame, columns=COLUMNS)
+
+
+def write_chunks(frames, path):
+    """Write DataFrames with the same columns to `path` one at a time.
+
+    Parquet (by extension) gets one or more row groups per frame; anything else
+    is written as CSV. Only one frame is held in memory at a time.
+    """
+    tmp_path = path + ".tmp"
+    rows = 0
+    if path.endswith(".parquet"):
+        writer = None
+        try:
+            for frame in frames:
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table)
+                rows += len(frame)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(tmp_path, "w", newline="") as out:
+            for i, frame in enumerate(frames):
+                frame.to_csv(out, index=False, header=i == 0, date_format="%Y-%m-%d")
+                rows += len(frame)
+    os.replace(tmp_path, path)
+    return rows
+
+
+def generate(spec, path):
+    """Generate `spec` into `path` (.parquet or .csv), chunk by chunk. Returns the row count."""
+    return write_chunks((spec.chunk(number) for number in range(spec.chunks)), path)
+
+
+def shard_path(directory, shard):
+    return os.path.join(directory, f"part-{shard:05d}.parquet")
+
+
+def _write_shard(spec, shard, directory):
+    # Runs in a worker process; the shard's chunks carry their own seeds, so
+    # which process writes it makes no difference
+    first = shard * SHARD_CHUNKS
+    numbers = range(first, min(spec.chunks, first + SHARD_CHUNKS))
+    return write_chunks((spec.chunk(number) for number in numbers), shard_path(directory, shard))
+
+
+def generate_sharded(spec, directory, workers=None):
+    """Generate `spec` as one Parquet file per shard in `directory`, `workers` shards at a time.
+
+    The shard files are one dataset: ``pd.read_parquet(directory)`` reads them
+    in order, and the dashboard loads the directory as its data file. Part
+    files left over from an earlier, larger run are removed. Returns the row
+    count.
+    """
+    os.makedirs(directory, exist_ok=True)
+    shards = range(spec.shards)
+    if workers == 1:
+        rows = sum(_write_shard(spec, shard, directory) for shard in shards)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = sum(pool.map(_write_shard, [spec] * len(shards), shards, [directory] * len(shards)))
+    written = {shard_path(directory, shard) for shard in shards}
+    for stale in glob.glob(os.path.join(directory, "part-*.parquet")):
+        if stale not in written:
+            os.remove(stale)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic hospital dataset.")
+    parser.add_argument(
+        "output", help="output file (.parquet for Parquet, .csv for CSV) or, without an extension, a shard directory"
+    )
+    parser.add_argument("--rows", type=int, default=2300)
+    parser.add_argument("--start", default="2024-01-01", help="first date (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=100, help="number of days the rows are spread over")
+    parser.add_argument("--departments", type=int, default=len(DEPARTMENT_FIELDS))
+    parser.add_argument("--doctors-per-department", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="processes for a shard directory (default: all CPUs)")
+    args = parser.parse_args(argv)
+
+    spec = DatasetSpec(args.rows, args.start, args.days, args.departments, args.doctors_per_department, args.seed)
+    started = time.perf_counter()
+    if os.path.splitext(args.output)[1]:
+        rows = generate(spec, args.output)
+    else:
+        rows = generate_sharded(spec, args.output, args.workers)
+    print(f"wrote {rows:,} rows to {args.output} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
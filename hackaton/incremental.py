@@ -0,0 +1,64 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from data_loader import DATA_FILE, dataset_version, load_dataset
+
+
+def grow_codes(keys, values):
+    """Integer codes of `values` against `keys`, adding unseen values to the end of `keys`.
+
+    Returns (keys, codes); existing codes never change, and missing values get
+    -1. Only the distinct values are looked up, not every row.
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype("category")
+    labels = values.cat.categories
+    new = labels.difference(keys, sort=False)
+    if len(new):
+        keys = keys.append(pd.Index(new, dtype=object))
+    mapping = np.append(keys.get_indexer(labels), -1)
+    return keys, mapping[values.cat.codes.to_numpy()]
+
+
+def appended_rows(df, built, path):
+    """The rows of `df` that `built` hasn't seen yet (the default `tail` of `shared_loader`)."""
+    return df.iloc[built.rows:]
+
+
+def shared_loader(build, columns=None, tail=appended_rows, show_spinner=True, max_entries=4):
+    """Return a `load(path=DATA_FILE)` function serving one `build(df)` per snapshot generation.
+
+    `df` is the dataset's `columns` (all when None). The built object is shared
+    by every session and kept current as rows are appended: it must have a
+    `rows` count of the rows it has seen and an `extend(rows)` method, which is
+    given `tail(df, built, path)` (by default just the new rows) under a lock,
+    so two sessions never extend it at once.
+
+    It is extended to the newest rows any session has pinned, so a rerun
+    pinned to fewer rows (see `data_loader.pin_snapshot`) may see a few rows
+    that its own page frame doesn't have yet.
+    """
+    lock = threading.Lock()
+
+    def cached(path, generation):
+        return build(load_dataset(columns, path=path))
+
+    # st.cache_resource keys on the function's name and source, which every
+    # loader made here shares; the builder's name tells their caches apart
+    cached.__qualname__ = f"{build.__qualname__}.shared"
+    cached = st.cache_resource(show_spinner=show_spinner, max_entries=max_entries)(cached)
+
+    def load(path=DATA_FILE):
+        generation, rows = dataset_version(path)
+        built = cached(path, generation)
+        if built.rows < rows:
+            with lock:
+                if built.rows < rows:
+                    built.extend(tail(load_dataset(columns, path=path), built, path))
+        return built
+
+    load.clear = cached.clear
+    return load
@@ -0,0 +1,86 @@
+import heapq
+
+import pandas as pd
+import streamlit as st
+
+from data_loader import FLOAT_COLUMNS, INT_COLUMNS
+from incremental import shared_loader
+
+# Rows shown on each side of a leaderboard widget
+LEADERBOARD_SIZE = 5
+
+
+def top_n(scores, n=10, ascending=False):
+    """The `n` highest (lowest with `ascending`) entries of `scores`, best first.
+
+    A heap-based partial selection, O(len(scores) x log n), so picking the
+    extremes never sorts every department or doctor. Missing scores are skipped;
+    ties keep the order of `scores`.
+    """
+    scores = scores.dropna()
+    if n >= len(scores):
+        return scores.sort_values(ascending=ascending, kind="stable")
+    select = heapq.nsmallest if ascending else heapq.nlargest
+    picked = select(n, range(len(scores)), key=scores.to_numpy().__getitem__)
+    return scores.iloc[picked]
+
+
+class Leaderboard:
+    """Running per-`dimension` totals of every metric, ranked with `top_n`.
+
+    Totals are updated with only the rows appended since the last update.
+    """
+
+    def __init__(self, df, dimension):
+        self.dimension = dimension
+        self.metrics = [col for col in INT_COLUMNS + FLOAT_COLUMNS if col in df.columns]
+        self.totals = pd.DataFrame(columns=["rows", *self.metrics], dtype=float)
+        self.rows = 0
+        self.extend(df)
+
+    def extend(self, df):
+        """Fold rows appended after the ones already counted into the totals."""
+        if df.empty:
+            return
+        grouped = df.groupby(self.dimension, observed=True)
+        added = grouped[self.metrics].sum().astype(float)
+        added.insert(0, "rows", grouped.size().astype(float))
+        totals = self.totals.add(added, fill_value=0.0)
+        totals.index.name = self.dimension
+        self.totals = totals
+        self.rows += len(df)
+
+    def scores(self, metric, how="sum"):
+        """Per-key total (`how="sum"`) or per-row mean (`how="mean"`) of `metric`."""
+        if how == "sum":
+            return self.totals[metric]
+        if how == "mean":
+            return self.totals[metric] / self.totals["rows"].where(self.totals["rows"] > 0)
+        raise ValueError(f"unsupported aggregation: {how}")
+
+
+def _department_leaderboard(df):
+    return Leaderboard(df, "departments")
+
+
+# load_department_leaderboard(path=DATA_FILE): the running leaderboard by department, kept current as rows are appended
+load_department_leaderboard = shared_loader(_department_leaderboard, show_spinner="Ranking...")
+
+
+def show_leaderboard(scores, label, n=LEADERBOARD_SIZE, ascending=False, value_format="%.2f"):
+    """Render the best and worst `n` entries of `scores` side by side.
+
+    `ascending` means lower scores are better (e.g. wait times).
+    """
+    name = scores.index.name or "name"
+    best, worst = st.columns(2)
+    for column, title, picked in [
+        (best, "Best", top_n(scores, n, ascending)),
+        (worst, "Worst", top_n(scores, n, not ascending)),
+    ]:
+        with column:
+            st.markdown(f"**{title} {n} by {label}**")
+            table = picked.rename(label).reset_index().rename(columns={"index": name})
+            table.index = range(1, len(table) + 1)
+            st.dataframe(table, use_container_width=True,
+                         column_config={label: st.column_config.NumberColumn(format=value_format)})
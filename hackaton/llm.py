@@ -0,0 +1,382 @@
+import abc
+import json
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import httpx
+import replicate
+
+# Connection pool per HTTP backend; a chat session only ever has one request in flight
+POOL_LIMITS = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+
+# Seconds to wait for the server to accept the request / to send the next chunk
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 120.0
+
+# Requests in flight per backend instance (i.e. per server); more wait for a free slot
+MAX_IN_FLIGHT = 4
+
+# Seconds a request waits for a free slot before giving up
+QUEUE_TIMEOUT = 30.0
+
+# Why a stream was stopped (StopSignal.reason): the caller cancelled it, or gave up on a deadline
+CANCELLED = "cancelled"
+TIMED_OUT = "timed out"
+
+# Backend instances kept at once (one per API token or server URL); the least recently used is closed past this
+MAX_BACKENDS = 8
+
+
+class BackendStats:
+    """Running latency, throughput and error counters for one backend."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.tokens = 0
+        self.first_token_seconds = 0.0
+        self.total_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, tokens, first_token_seconds, total_seconds, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.tokens += tokens
+            self.first_token_seconds += first_token_seconds or 0.0
+            self.total_seconds += total_seconds
+
+    def add(self, other):
+        with other._lock:
+            counts = (other.requests, other.errors, other.tokens, other.first_token_seconds, other.total_seconds)
+        with self._lock:
+            self.requests += counts[0]
+            self.errors += counts[1]
+            self.tokens += counts[2]
+            self.first_token_seconds += counts[3]
+            self.total_seconds += counts[4]
+
+    def summary(self):
+        """Averages over all requests so far, for display."""
+        with self._lock:
+            requests = self.requests or 1
+            return {
+                "requests": self.requests,
+                "error_rate": self.errors / requests,
+                "avg_first_token_s": self.first_token_seconds / requests,
+                "avg_latency_s": self.total_seconds / requests,
+                "tokens_per_s": self.tokens / self.total_seconds if self.total_seconds else 0.0,
+            }
+
+
+class StreamStopped(Exception):
+    """Raised by `LLMBackend.stream` when its StopSignal was set before the reply ended."""
+
+
+class StopSignal:
+    """Asks a stream to stop, from any thread.
+
+    Streams check it between chunks. A stream waiting on the server registers a
+    callback with `interrupting` that breaks the wait off; `set` runs it, so a
+    stalled backend stops at once instead of at its read timeout.
+    """
+
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def set(self, reason=CANCELLED):
+        """Stop the stream; only the first reason given is kept."""
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            self._event.set()
+            for callback in self._callbacks:
+                callback()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        """Sleep up to `timeout` seconds, returning True early if the signal is set."""
+        return self._event.wait(timeout)
+
+    @property
+    def timed_out(self):
+        return self.reason == TIMED_OUT
+
+    @contextmanager
+    def interrupting(self, callback):
+        """Run `callback` if the signal is set while the block runs (at once if it already is)."""
+        with self._lock:
+            if self.reason is not None:
+                callback()
+            self._callbacks.append(callback)
+        try:
+            yield
+        finally:
+            # Under the lock, so a callback never runs once the block has ended
+            with self._lock:
+                self._callbacks.remove(callback)
+
+
+def _shutdown(response):
+    # Closing a response from another thread doesn't wake a read blocked on it; shutting its socket down does
+    network_stream = response.extensions.get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class LLMBackend(abc.ABC):
+    """A text-generation backend that streams its reply.
+
+    Subclasses implement `_stream`, yielding text chunks (roughly one token
+    each). Callers use `stream`, which also records the backend's stats.
+    Instances hold their connections open and are meant to be reused; get them
+    through `get_backend`.
+    """
+
+    name = "backend"
+
+    def __init__(self):
+        self.stats = BackendStats()
+        self._slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+        self._in_flight = 0
+        self._retired = False
+        self._state_lock = threading.Lock()
+
+    def stream(self, model, prompt, stop=None, **params):
+        """Yield the reply to `prompt` piece by piece.
+
+        `params` are Llama 2 style sampling options (temperature, top_p,
+        max_length, repetition_penalty); backends map them to their own API.
+        At most MAX_IN_FLIGHT streams run at once per backend. Setting `stop`
+        (a StopSignal) ends the stream with StreamStopped, even mid-read; one
+        stopped for TIMED_OUT counts as an error in the stats.
+        """
+        stop = stop if stop is not None else StopSignal()
+        if not self._slots.acquire(timeout=QUEUE_TIMEOUT):
+            self.stats.record(0, None, QUEUE_TIMEOUT, error=True)
+            raise TimeoutError(f"{self.name} is busy, try again shortly")
+        with self._state_lock:
+            self._in_flight += 1
+        started = time.monotonic()
+        first_token, tokens, error = None, 0, True
+        try:
+            for chunk in self._stream(model, prompt, stop, **params):
+                if stop.is_set():
+                    break
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                tokens += 1
+                yield chunk
+            if stop.is_set():
+                raise StreamStopped(stop.reason)
+            error = False
+        except GeneratorExit:
+            # The caller stopped reading; not a backend error unless it gave up on a deadline (below)
+            error = False
+            raise
+        except Exception as exc:
+            # A read broken off by `stop` fails with whatever the transport raises
+            if stop.is_set() and not isinstance(exc, StreamStopped):
+                raise StreamStopped(stop.reason) from exc
+            raise
+        finally:
+            if stop.is_set():
+                error = stop.timed_out
+            # Also runs when the consumer stops early (generator closed)
+            self._slots.release()
+            self.stats.record(tokens, first_token, time.monotonic() - started, error=error)
+            with self._state_lock:
+                self._in_flight -= 1
+                idle = self._retired and not self._in_flight
+            if idle:
+                self.close()
+
+    @abc.abstractmethod
+    def _stream(self, model, prompt, stop, **params):
+        """Yield the reply's text chunks; called by `stream` within a free slot.
+
+        While waiting on the server, break the wait off when `stop` is set
+        (see `StopSignal.interrupting`).
+        """
+
+    def retire(self):
+        """Close the backend now, or when its last stream in flight ends."""
+        with self._state_lock:
+            self._retired = True
+            idle = not self._in_flight
+        if idle:
+            self.close()
+
+    @property
+    def closed(self):
+        """True once the backend is retired and has no stream in flight."""
+        with self._state_lock:
+            return self._retired and not self._in_flight
+
+    def close(self):
+        pass
+
+
+class ReplicateBackend(LLMBackend):
+    """Models hosted on Replicate, streamed over server-sent events."""
+
+    name = "Replicate"
+
+    def __init__(self, api_token):
+        super().__init__()
+        # The client keeps one httpx connection pool for its whole lifetime
+        self.client = replicate.Client(api_token=api_token)
+
+    def _stream(self, model, prompt, stop, **params):
+        name, _, version = model.partition(":")
+        input = {"prompt": prompt, **params}
+        if version:
+            prediction = self.client.predictions.create(version=version, input=input, stream=True)
+        else:
+            prediction = self.client.models.predictions.create(model=name, input=input, stream=True)
+
+        def cancel():
+            # Cancelling the prediction ends its event stream; on its own thread, so `stop.set` doesn't wait on the API
+            threading.Thread(target=prediction.cancel, daemon=True).start()
+
+        with stop.interrupting(cancel):
+            for event in prediction.stream():
+                if getattr(getattr(event, "event", None), "value", None) == "error":
+                    raise RuntimeError(f"model error: {event.data}")
+                text = str(event)
+                if text:
+                    yield text
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """A local server speaking the OpenAI completions API (llama.cpp, vLLM, Ollama, ...)."""
+
+    name = "Local server"
+
+    def __init__(self, base_url, api_key=None):
+        super().__init__()
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            limits=POOL_LIMITS,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+
+    def _stream(self, model, prompt, stop, temperature=None, top_p=None, max_length=None, **params):
+        body = {"model": model, "prompt": prompt, "stream": True}
+        for key, value in (("temperature", temperature), ("top_p", top_p), ("max_tokens", max_length)):
+            if value is not None:
+                body[key] = value
+        with self.client.stream("POST", "/completions", json=body) as response, \
+                stop.interrupting(lambda: _shutdown(response)):
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    # Keep reading to the end of the body so the connection goes back to the pool
+                    continue
+                choices = json.loads(data).get("choices") or [{}]
+                text = choices[0].get("text", "")
+                if text:
+                    yield text
+
+    def close(self):
+        self.client.close()
+
+
+class StubBackend(LLMBackend):
+    """In-process backend for tests and offline demos; replies with canned text."""
+
+    name = "Stub"
+
+    def __init__(self, reply=None, delay=0.0):
+        super().__init__()
+        self.reply = reply
+        self.delay = delay
+
+    def _stream(self, model, prompt, stop, **params):
+        reply = self.reply or f"(stub reply from {model})"
+        for i, word in enumerate(reply.split(" ")):
+            if self.delay and stop.wait(self.delay):
+                return
+            yield word if i == 0 else " " + word
+
+
+BACKENDS = {
+    backend.name: backend for backend in (ReplicateBackend, OpenAICompatibleBackend, StubBackend)
+}
+
+# Backends for tests and demos, left out of `backend_names` unless asked for
+DEBUG_BACKENDS = {StubBackend.name}
+
+_backends = OrderedDict()
+# Backends evicted from `_backends` with streams still in flight, then just their stats once closed
+_retiring = []
+_retired_stats = {}
+_backends_lock = threading.Lock()
+
+
+def _fold_retired():
+    # Called with _backends_lock held; a closed backend's stats are final, so only they are kept
+    for backend in [backend for backend in _retiring if backend.closed]:
+        _retired_stats.setdefault(backend.name, BackendStats()).add(backend.stats)
+        _retiring.remove(backend)
+
+
+def backend_names(debug=False):
+    """Names of the backends to offer, including the DEBUG_BACKENDS with `debug`."""
+    return [name for name in BACKENDS if debug or name not in DEBUG_BACKENDS]
+
+
+def get_backend(name, **config):
+    """Return the shared backend `name` for `config`, creating it on first use.
+
+    One instance (and so one connection pool) exists per distinct
+    configuration, e.g. per API token or server URL. At most MAX_BACKENDS are
+    kept; past that the least recently used is retired, closing its
+    connections once its streams in flight end.
+    """
+    key = (name, tuple(sorted(config.items())))
+    with _backends_lock:
+        if key in _backends:
+            _backends.move_to_end(key)
+            return _backends[key]
+        backend = _backends[key] = BACKENDS[name](**config)
+        evicted = []
+        while len(_backends) > MAX_BACKENDS:
+            evicted.append(_backends.popitem(last=False)[1])
+        _fold_retired()
+        _retiring.extend(evicted)
+    # Closed outside the lock, so a slow close doesn't hold up other sessions
+    for old in evicted:
+        old.retire()
+    return backend
+
+
+def backend_stats():
+    """{backend name: stats summary}, combined over every configuration of a backend."""
+    with _backends_lock:
+        _fold_retired()
+        backends = list(_backends.values()) + _retiring
+        merged = {}
+        for name, stats in _retired_stats.items():
+            merged.setdefault(name, BackendStats()).add(stats)
+    for backend in backends:
+        merged.setdefault(backend.name, BackendStats()).add(backend.stats)
+    return {name: stats.summary() for name, stats in merged.items()}
@@ -0,0 +1,282 @@
+"""Headless load test: concurrent dashboard sessions making random sidebar changes.
+
+Each simulated session is its own AppTest instance, run on its own thread in
+this process, so all sessions share the process-wide caches just as sessions
+on one Streamlit server do. A session opens a random page and then keeps
+changing one sidebar widget at a time (date range, department, refer reason,
+staff ratio, doctor, day of week, Overview view, ...) and rerunning, like a
+user exploring the data.
+
+    python loadtest.py --sessions 16 --duration 120 --output load.json
+
+Point the pages at a bigger dataset with HOSPITAL_DATA_FILE: a CSV, a Parquet file
+or a shard directory written by generator.py.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+from benchmark import OVERVIEW_VIEWS, SKIPPED_PAGES, current_rss
+
+# Reruns on one page before a session moves to another page
+RERUNS_PER_PAGE = 10
+
+# Chance that a multiselect change clears the widget instead of picking values
+CLEAR_CHANCE = 0.3
+
+# Most values picked in one multiselect change
+MAX_PICKED = 3
+
+# How often process memory is sampled, in seconds
+RSS_SAMPLE_SECONDS = 0.05
+
+PERCENTILES = [50, 95, 99]
+
+
+def page_scripts(app_dir):
+    """Scripts a session can open, relative to `app_dir`."""
+    pages = sorted(
+        os.path.join("pages", name) for name in os.listdir(os.path.join(app_dir, "pages"))
+        if name.endswith(".py") and name not in SKIPPED_PAGES
+    )
+    return ["Overview.py", *pages]
+
+
+def _random_change(at, rng):
+    # Change one sidebar widget at random; returns a short description of the change
+    dates = {box.label: box for box in at.sidebar.date_input}
+    boxes = [box for box in at.sidebar.multiselect if box.options]
+    views = [box for box in at.sidebar.selectbox if box.label == "Select a page"]
+    choices = ["dates"] * bool(len(dates) == 2) + ["multiselect"] * 3 * bool(boxes) + ["view"] * bool(views)
+    if not choices:
+        return "rerun"
+    choice = rng.choice(choices)
+    if choice == "dates":
+        start, end = dates["Start Date"], dates["End Date"]
+        first, last = start.value, end.value
+        if first > last:
+            first, last = last, first
+        span = (last - first).days
+        # A random sub-range of the current range, or back to a wide one now and then
+        if span < 2 or rng.random() < 0.25:
+            first, last = first - datetime.timedelta(days=30), last + datetime.timedelta(days=30)
+        else:
+            offset = rng.randrange(span)
+            first, last = first + datetime.timedelta(days=offset), first + datetime.timedelta(days=rng.randrange(offset, span) + 1)
+        start.set_value(first)
+        end.set_value(last)
+        return f"dates {first}..{last}"
+    if choice == "view":
+        views[0].select(rng.choice(OVERVIEW_VIEWS))
+        return f"view {views[0].value}"
+    box = rng.choice(boxes)
+    if box.value and rng.random() < CLEAR_CHANCE:
+        box.set_value([])
+        return f"clear {box.label}"
+    picked = rng.sample(list(box.options), rng.randint(1, min(MAX_PICKED, len(box.options))))
+    box.set_value(picked)
+    return f"{box.label}: {picked}"
+
+
+class Session(threading.Thread):
+    """One simulated user: opens random pages and changes their sidebar until `deadline`."""
+
+    def __init__(self, number, app_dir, scripts, deadline, seed, timeout):
+        super().__init__(name=f"session-{number}", daemon=True)
+        self.app_dir = app_dir
+        self.scripts = scripts
+        self.deadline = deadline
+        self.rng = random.Random(f"{seed}-{number}")
+        self.timeout = timeout
+        # (page, seconds, first run of the page) per rerun
+        self.latencies = []
+        self.errors = []
+
+    def _timed_run(self, script, at, first):
+        started = time.perf_counter()
+        at.run(timeout=self.timeout)
+        self.latencies.append((script, time.perf_counter() - started, first))
+        for error in at.exception:
+            self.errors.append(f"{script}: {error.value}")
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+
+        while time.monotonic() < self.deadline:
+            script = self.rng.choice(self.scripts)
+            at = AppTest.from_file(os.path.join(self.app_dir, script), default_timeout=self.timeout)
+            self._timed_run(script, at, True)
+            for _ in range(RERUNS_PER_PAGE):
+                if time.monotonic() >= self.deadline or at.exception:
+                    break
+                try:
+                    _random_change(at, self.rng)
+                except Exception as error:
+                    # A value that a rerun has just made invalid; move on with another change
+                    self.errors.append(f"{script}: change failed: {error!r}")
+                    continue
+                self._timed_run(script, at, False)
+
+
+class MemorySampler(threading.Thread):
+    """Peak RSS of the process while the sessions run."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.baseline = current_rss()
+        self.peak = self.baseline
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _share_runtime():
+    """Let AppTest instances run concurrently, sharing one mock runtime like sessions on one server.
+
+    AppTest installs a fresh mock Runtime around every run and removes it
+    afterwards, so overlapping runs on different threads would pull it out from
+    under each other (and st.cache_data would not be shared). Here one runtime
+    is installed for the whole load test and AppTest's own install/remove is
+    pointed at a stand-in class. The global AppTest config flag is set up front
+    for the same reason.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    app_test.Runtime = type("PerRunRuntime", (Runtime,), {})
+    config.set_option("global.appTest", True)
+    # Session threads aren't script threads; Streamlit warns about that on every page open
+    logging.getLogger("streamlit.runtime.scriptrunner.script_run_context").setLevel(logging.ERROR)
+
+
+def _summary(seconds):
+    if not seconds:
+        return {"reruns": 0}
+    values = np.asarray(seconds)
+    percentiles = np.percentile(values, PERCENTILES)
+    return {
+        "reruns": len(values),
+        "mean_s": float(values.mean()),
+        **{f"p{p}_s": float(value) for p, value in zip(PERCENTILES, percentiles)},
+        "max_s": float(values.max()),
+    }
+
+
+def run(sessions=8, duration=60.0, seed=0, timeout=120, pages=None):
+    """Run `sessions` concurrent sessions for `duration` seconds and return the report."""
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    # Imported once up front so every page's data path is instrumented, then the
+    # dataset is ingested, so the sessions measure serving rather than ingest
+    import profiler
+    from data_loader import DATA_FILE, date_bounds
+
+    date_bounds()
+    scripts = pages or page_scripts(app_dir)
+    _share_runtime()
+
+    sampler = MemorySampler()
+    sampler.start()
+    started = time.monotonic()
+    workers = [Session(number, app_dir, scripts, started + duration, seed, timeout) for number in range(sessions)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+    sampler.stop()
+
+    reruns = [entry for worker in workers for entry in worker.latencies]
+    by_page = {}
+    for script, seconds, first in reruns:
+        by_page.setdefault(script, []).append(seconds)
+    errors = [error for worker in workers for error in worker.errors]
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "dataset": DATA_FILE,
+        "sessions": sessions,
+        "duration_s": elapsed,
+        "throughput_reruns_per_s": len(reruns) / elapsed if elapsed else 0.0,
+        "latency": _summary([seconds for _, seconds, _ in reruns]),
+        "first_load_latency": _summary([seconds for _, seconds, first in reruns if first]),
+        "interaction_latency": _summary([seconds for _, seconds, first in reruns if not first]),
+        "pages": {script: _summary(seconds) for script, seconds in sorted(by_page.items())},
+        "memory": {
+            "baseline_rss_bytes": sampler.baseline,
+            "peak_rss_bytes": sampler.peak,
+            "per_session_bytes": (sampler.peak - sampler.baseline) / max(sessions, 1),
+        },
+        "errors": errors[:50],
+        "error_count": len(errors),
+    }
+
+
+def report(result):
+    """The load test result as text."""
+    def line(name, summary):
+        if not summary["reruns"]:
+            return f"  {name}: no reruns"
+        return (f"  {name}: {summary['reruns']} reruns, p50 {summary['p50_s'] * 1000:.0f}ms, "
+                f"p95 {summary['p95_s'] * 1000:.0f}ms, p99 {summary['p99_s'] * 1000:.0f}ms")
+
+    memory = result["memory"]
+    lines = [
+        f"{result['sessions']} sessions for {result['duration_s']:.0f}s on {result['dataset']}: "
+        f"{result['throughput_reruns_per_s']:.1f} reruns/s",
+        line("all reruns", result["latency"]),
+        line("page opens", result["first_load_latency"]),
+        line("interactions", result["interaction_latency"]),
+        *(line(script, summary) for script, summary in result["pages"].items()),
+        f"  memory: peak {memory['peak_rss_bytes'] / 2 ** 20:.0f}MB, "
+        f"{memory['per_session_bytes'] / 2 ** 20:.1f}MB per session over the {memory['baseline_rss_bytes'] / 2 ** 20:.0f}MB baseline",
+    ]
+    if result["error_count"]:
+        lines.append(f"  {result['error_count']} errors, e.g. {result['errors'][0]}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the dashboard with concurrent simulated sessions.")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds before a single rerun fails")
+    parser.add_argument("--pages", nargs="+", help="scripts to open (default: Overview.py and every data page)")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    result = run(args.sessions, args.duration, args.seed, args.timeout, args.pages)
+    print(report(result))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(result, out, indent=2)
+    return 1 if result["error_count"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,46 +1,55 @@
 import os
 import streamlit as st
-import replicate
 from dotenv import load_dotenv
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+# First, so the shared data path imported below is timed from the very first run
+from profiler import debug_enabled, profile_rerun
+from chat import (
+    HISTORY_TOKEN_BUDGET, REPLY_POLL_SECONDS, REPLY_TIMEOUT_NOTE, STREAM_CURSOR, ConversationMemory, ResponseCache,
+    submit_reply,
+)
+from data_loader import DATA_FILE, dataset_version, pin_snapshot
+import plotly.express as px
+from charts import cached_figure, filter_state
+from llm import StopSignal, backend_names, backend_stats, get_backend
+from query import answer_question
+from rollup import load_cube
+
+# Stage timings for this run; shown in the sidebar with ?debug=1
+profile = profile_rerun("Chatbot")
+
+# One snapshot for the whole rerun, so rows appended mid-run can't split the answers from their cache keys
+pin_snapshot()
 
 # Load environment variables from .env file (if you're using it)
 load_dotenv()
 
-# Placeholder for dataset loading function
-@st.cache_data
-def load_data(file_path='fake_healthcare_2.csv'):
-    # Replace with your dataset loading logic
-    data = pd.read_csv('fake_healthcare_2.csv')
-    return data
+# Replies to repeated questions are served from here, across sessions and restarts
+RESPONSE_CACHE_FILE = os.getenv('CHAT_CACHE_FILE', 'chat_cache.json')
+
+@st.cache_resource
+def response_cache():
+    return ResponseCache(RESPONSE_CACHE_FILE)
 
 # Function to visualize data
-def visualize_data(data, department, metric):
-    filtered_data = data[data['departments'] == department]
-    plt.figure(figsize=(10, 6))
-    sns.lineplot(data=filtered_data, x=filtered_data.index, y=metric)
-    plt.title(f'{metric.capitalize()} Over Time for {department.capitalize()} Department')
-    plt.xlabel('Date')
-    plt.ylabel(metric.capitalize())
-    st.pyplot(plt)
+def visualize_data(department, metric, file_path=DATA_FILE):
+    # Daily department averages come from the rollup cube and the figure is cached across sessions
+    def build():
+        daily = load_cube(file_path).view(selections={'departments': [department]}).over_time('D', **{metric: 'mean'})
+        fig = px.line(daily.reset_index(), x='daily', y=metric,
+                      title=f'{metric.capitalize()} Over Time for {department.capitalize()} Department')
+        fig.update_layout(xaxis_title='Date', yaxis_title=metric.capitalize())
+        return fig
+
+    fig = cached_figure('Chatbot', 'department_trend', filter_state(departments=[department], metric=[metric]),
+                        build, file_path)
+    st.plotly_chart(fig, use_container_width=True)
 
 # Function to interpret and query dataset
 def interpret_and_query_dataset(query):
-    if 'average' in query.lower():
-        metric = query.split('average of ')[-1]
-        if metric in data.columns:
-            average_value = data[metric].mean()
-            return f"The average {metric} is {average_value:.2f}."
-    elif 'total' in query.lower():
-        metric = query.split('total of ')[-1]
-        if metric in data.columns:
-            total_value = data[metric].sum()
-            return f"The total {metric} is {total_value:.2f}."
-    return "I'm sorry, I don't understand the query."
-
-data = load_data()
+    # Parsed into filter/group/aggregate steps and answered from the rollup cube
+    answer = answer_question(query)
+    return answer if answer is not None else "I'm sorry, I don't understand the query."
 
 with st.sidebar:
     st.title('Llama 2 Chatbot')
@@ -48,81 +57,144 @@ with st.sidebar:
 
     st.success('API key already provided!', icon='✅')
 
-    replicate_api = st.text_input('Enter Replicate API token:', type='password')
-    if not (replicate_api.startswith('r8_') and len(replicate_api) == 40):
-        st.warning('Please enter your credentials!', icon='⚠️') 
+    # The offline stub backend is only offered with the debug flag (?debug=1 or DASHBOARD_DEBUG=1)
+    backend_name = st.selectbox('Choose a backend', backend_names(debug_enabled()), key='backend')
+    if backend_name == 'Replicate':
+        replicate_api = st.text_input('Enter Replicate API token:', type='password')
+        if not (replicate_api.startswith('r8_') and len(replicate_api) == 40):
+            st.warning('Please enter your credentials!', icon='⚠️') 
+        else:
+            st.success('Proceed to entering your prompt message!', icon='👉')
+        backend_config = {"api_token": replicate_api}
+        backend_ready = bool(replicate_api)
+    elif backend_name == 'Local server':
+        # Any server exposing the OpenAI completions API, e.g. llama.cpp or vLLM
+        base_url = st.text_input('Server URL', os.getenv('LLM_BASE_URL', 'http://localhost:8000/v1'))
+        backend_config = {"base_url": base_url, "api_key": os.getenv('LLM_API_KEY')}
+        backend_ready = bool(base_url)
     else:
-        st.success('Proceed to entering your prompt message!', icon='👉')
+        backend_config = {}
+        backend_ready = True
 
     st.subheader('Models and parameters')
-    selected_model = st.selectbox('Choose a Llama2 model', ['Llama2-7B', 'Llama2-13B'], key='selected_model')
-    if selected_model == 'Llama2-7B':
-        llm = 'a16z-infra/llama7b-v2-chat:4f0a4744c7295c024a1de15e1a63c880d3da035fa1f49bfd344fe076074c8eea'
-    elif selected_model == 'Llama2-13B':
-        llm = 'a16z-infra/llama13b-v2-chat:df7690f1994d94e96ad9d568eac121aecf50684a0b0963b25a41cc40061269e5'
+    if backend_name == 'Local server':
+        llm = st.text_input('Model name', os.getenv('LLM_MODEL', 'llama-2-7b-chat'))
+    else:
+        selected_model = st.selectbox('Choose a Llama2 model', ['Llama2-7B', 'Llama2-13B'], key='selected_model')
+        if selected_model == 'Llama2-7B':
+            llm = 'a16z-infra/llama7b-v2-chat:4f0a4744c7295c024a1de15e1a63c880d3da035fa1f49bfd344fe076074c8eea'
+        elif selected_model == 'Llama2-13B':
+            llm = 'a16z-infra/llama13b-v2-chat:df7690f1994d94e96ad9d568eac121aecf50684a0b0963b25a41cc40061269e5'
     temperature = st.slider('temperature', min_value=0.01, max_value=1.0, value=0.1, step=0.01)
     top_p = st.slider('top_p', min_value=0.01, max_value=1.0, value=0.9, step=0.01)
     max_length = st.slider('max_length', min_value=32, max_value=128, value=120, step=8)
+    # Older turns beyond this many prompt tokens are summarized and dropped
+    history_budget = st.slider('history_tokens', min_value=256, max_value=3584, value=HISTORY_TOKEN_BUDGET, step=256)
+    with st.expander('Backend stats'):
+        stats = backend_stats()
+        if stats:
+            st.dataframe(pd.DataFrame(stats).T)
+        else:
+            st.write('No requests yet.')
+        st.write(f'Response cache: {response_cache().hits} hits, {response_cache().misses} misses')
     st.markdown('📖 Learn how to build this app in this [blog](https://blog.streamlit.io/how-to-build-a-llama-2-chatbot/)!')
 
     st.subheader('Data Visualization')
-    department = st.selectbox('Select Department', data['departments'].unique())
+    department = st.selectbox('Select Department', load_cube().frame['departments'].cat.categories)
     metric = st.selectbox('Select Metric', ['daily_visits', 'daily_admissions', 'admission_rate', 'occupancy_rate'])
     if st.button('Visualize'):
-        visualize_data(data, department, metric)
+        visualize_data(department, metric)
 
 # Store LLM generated responses
 if "messages" not in st.session_state.keys():
     st.session_state.messages = [{"role": "assistant", "content": "How may I assist you today?"}]
+# Prompt window over the messages, kept per session and extended one turn at a time
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+st.session_state.memory.budget = history_budget
 
 # Display or clear chat messages
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.write(message["content"])
 
+def cancel_pending_reply():
+    pending = st.session_state.pop("pending", None)
+    if pending is not None:
+        pending.cancel()
+
 def clear_chat_history():
+    cancel_pending_reply()
     st.session_state.messages = [{"role": "assistant", "content": "How may I assist you today?"}]
 st.sidebar.button('Clear Chat History', on_click=clear_chat_history)
 
-# Function for generating LLaMA2 response
-def generate_llama2_response(prompt_input, api_key):
-    client = replicate.Client(api_token=api_key)
-    string_dialogue = "You are a helpful assistant. You do not respond as 'User' or pretend to be 'User'. You only respond once as 'Assistant'."
-    for dict_message in st.session_state.messages:
-        if dict_message["role"] == "user":
-            string_dialogue += "User: " + dict_message["content"] + "\n\n"
-        else:
-            string_dialogue += "Assistant: " + dict_message["content"] + "\n\n"
+def history_prompt(prompt_input):
+    memory = st.session_state.memory
+    memory.sync(st.session_state.messages)
+    return memory.prompt(prompt_input)
 
-    # Check if the prompt is a dataset-related query
+# Function for generating LLaMA2 response, as an iterator of text chunks; `stop` interrupts the backend stream
+def generate_llama2_response(prompt_input, stop):
+    # Anything answerable from the data is answered directly, without an LLM round trip
     if 'dataset' in prompt_input.lower():
-        response = interpret_and_query_dataset(prompt_input)
+        return iter([interpret_and_query_dataset(prompt_input)])
+    answer = answer_question(prompt_input)
+    if answer is not None:
+        return iter([answer])
+
+    cache = response_cache()
+    key = ResponseCache.key(prompt_input, f"{backend_name}:{llm}", temperature, top_p, max_length, dataset_version())
+    cached = cache.get(key)
+    if cached is not None:
+        return iter([cached])
+
+    # Backends are shared across reruns and sessions, so connections are reused
+    backend = get_backend(backend_name, **backend_config)
+    # Tokens are yielded as the model produces them instead of after the whole reply
+    return cache.cached_stream(key, backend.stream(
+        llm, history_prompt(prompt_input), stop,
+        temperature=temperature, top_p=top_p, max_length=max_length, repetition_penalty=1,
+    ))
+
+# The reply is generated on a worker thread; only this fragment reruns while it streams in,
+# so the rest of the page (sidebar included) stays usable
+@st.fragment(run_every=REPLY_POLL_SECONDS)
+def show_pending_reply():
+    pending = st.session_state.get("pending")
+    if pending is None:
+        return
+    if not pending.done and pending.expired:
+        # Checked here, not only by the worker: a stalled backend sends no next chunk to check it on
+        pending.expire()
+    if not pending.done and not pending.timed_out:
+        st.markdown(pending.text + STREAM_CURSOR if pending.text else "Thinking...")
+        return
+    del st.session_state["pending"]
+    if pending.timed_out:
+        # Whatever arrived before the deadline is kept
+        content = pending.text + REPLY_TIMEOUT_NOTE if pending.text else "Sorry, the model took too long to answer."
+    elif pending.error is not None:
+        content = f"Sorry, I couldn't get an answer: {pending.error}"
     else:
-        output = client.run(
-            llm,
-            input={"prompt": f"{string_dialogue} {prompt_input} Assistant: ",
-                   "temperature": temperature, "top_p": top_p, "max_length": max_length, "repetition_penalty": 1}
-        )
-        response = ''.join(output)
-    
-    return response
+        content = pending.text
+    st.session_state.messages.append({"role": "assistant", "content": content})
+    st.rerun()
 
 # User-provided prompt
-if prompt := st.chat_input(disabled=not replicate_api):
+if prompt := st.chat_input(disabled=not backend_ready):
+    # A new prompt supersedes a reply that is still being generated
+    cancel_pending_reply()
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.write(prompt)
 
 # Generate a new response if last message is not from assistant
 if st.session_state.messages[-1]["role"] != "assistant":
+    if "pending" not in st.session_state:
+        stop = StopSignal()
+        st.session_state.pending = submit_reply(generate_llama2_response(st.session_state.messages[-1]["content"], stop),
+                                                stop=stop)
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            response = generate_llama2_response(prompt, replicate_api)
-            placeholder = st.empty()
-            full_response = ''
-            for item in response:
-                full_response += item
-                placeholder.markdown(full_response)
-            placeholder.markdown(full_response)
-    message = {"role": "assistant", "content": full_response}
-    st.session_state.messages.append(message)
+        show_pending_reply()
+
+profile.finish()
@@ -1,25 +1,39 @@
 import streamlit as st
 import plotly.express as px
 import pandas as pd
+# First, so the shared data path imported below is timed from the very first run
+from profiler import profile_rerun
+from data_loader import date_bounds, load_dataset, pin_snapshot
+from filters import sidebar_filters
+from rollup import summarize
+from leaderboard import load_department_leaderboard, show_leaderboard, top_n
+from rolling import show_rolling_trends
+from timeseries import TICK_FORMATS
 
 def run():
     pass
 
+# Stage timings for this run; shown in the sidebar with ?debug=1
+profile = profile_rerun("Hospital Performance")
+
 st.title(" :bar_chart: Helpman Healthcare Hospital Performance Interactive Dashboard")
 
 st.write("Information about the app.")
 
 st.markdown('<style>div.block-container{padding-top:2rem;}</style>', unsafe_allow_html=True)
 
-df = pd.read_csv("fake_healthcare_2.csv")
+# Columns used by this page; the page frame is a view of just these columns of the shared snapshot
+COLUMNS = [
+    'departments', 'refer_reason', 'staff_patient_ratio', 'daily_visits', 'admission_rate',
+    'patient_days', 'daily_discharge', 'wait_time', 'daily_readmission', 'equip_count',
+    'equip_use', 'occupancy_rate', 'readmission_rate', 'bed_turnover'
+]
 
-# Ensure the date column is datetime and set as index
-df['date'] = pd.to_datetime(df['date'])
-df.set_index('date', inplace=True)
+# One snapshot for the whole rerun, so rows appended mid-run can't split the page frame from its filters and caches
+pin_snapshot()
 
-# Getting the min and max date
-startDate = df.index.min()
-endDate = df.index.max()
+# Getting the min and max date (the first and last rows of the date-sorted snapshot, without scanning it)
+startDate, endDate = date_bounds()
 
 st.sidebar.header("Filter by Date")
 date1 = st.sidebar.date_input("Start Date", startDate)
@@ -29,41 +43,31 @@ date2 = st.sidebar.date_input("End Date", endDate)
 date1 = pd.to_datetime(date1)
 date2 = pd.to_datetime(date2)
 
-# Filter the DataFrame based on selected dates
-df = df[(df.index >= date1) & (df.index <= date2)].copy()
+# Only the selected date range: a binary-searched slice of the snapshot, not a scan or a copy
+df = load_dataset(COLUMNS, date1, date2)
 
 st.sidebar.header("Choose your filter: ")
-
-# Create filter for Department
-wait = st.sidebar.multiselect("Hospital wait time", df["wait_time"].unique())
-if not wait:
-    df2 = df.copy()
-else:
-    df2 = df[df["wait_time"].isin(wait)]
-
-# Create filter for Refer Reason
-refer = st.sidebar.multiselect("Pick the refer reason", df2["refer_reason"].unique())
-if not refer:
-    df3 = df2.copy()
-else:
-    df3 = df2[df2["refer_reason"].isin(refer)]
-
-# Create filter for Staff to Patient Ratio
-staff_patient = st.sidebar.multiselect("Pick the Staff to Patient Ratio", df3["staff_patient_ratio"].unique())
-if not staff_patient:
-    filtered_df = df3.copy()
-else:
-    filtered_df = df3[df3["staff_patient_ratio"].isin(staff_patient)]
+# Every filter is applied as one combined mask; options only list values still present
+filtered_df, selections = sidebar_filters(df, date1, date2, [
+    ("wait_time", "Hospital wait time"),
+    ("refer_reason", "Pick the refer reason"),
+    ("staff_patient_ratio", "Pick the Staff to Patient Ratio"),
+])
+
+# KPIs and department charts are answered from the pre-aggregated rollup cube
+# (date range only for the patient summary, all sidebar filters for the rest)
+period_summary = summarize(df, date1, date2)
+summary = summarize(filtered_df, date1, date2, selections)
 
 # Overview Page
 st.header("Overview")
 
 # Calculate summary metrics for patient data
 patient_metrics = {
-    "total_patient_days": df['patient_days'].sum() if 'patient_days' in df.columns else None,
-    "total_daily_discharge": df['daily_discharge'].sum() if 'daily_discharge' in df.columns else None,
-    "avg_wait_time": df['wait_time'].mean() if 'wait_time' in df.columns else None,
-    "total_daily_readmission": df['daily_readmission'].sum() if 'daily_readmission' in df.columns else None,
+    "total_patient_days": period_summary.total('patient_days') if 'patient_days' in period_summary.metrics else None,
+    "total_daily_discharge": period_summary.total('daily_discharge') if 'daily_discharge' in period_summary.metrics else None,
+    "avg_wait_time": period_summary.mean('wait_time') if 'wait_time' in period_summary.metrics else None,
+    "total_daily_readmission": period_summary.total('daily_readmission') if 'daily_readmission' in period_summary.metrics else None,
 }
 
 # Display the metrics
@@ -104,11 +108,8 @@ fig.update_traces(marker=dict(size=10, opacity=0.7))
 st.plotly_chart(fig, use_container_width=True)
 
 
-# Filter the dataset for equip_count and equip_use
-filtered_equip_df = filtered_df[['wait_time', 'equip_count', 'equip_use']]
-
 # Sum the values for equip_count and equip_use within the filtered dataset
-aggregated_data = filtered_equip_df[['equip_count', 'equip_use']].sum()
+aggregated_data = {metric: summary.total(metric) for metric in ['equip_count', 'equip_use']}
 
 # Create a doughnut chart
 st.header("Equipment Usage")
@@ -130,22 +131,37 @@ st.plotly_chart(fig, use_container_width=True)
 
 # Time Series Analysis
 st.subheader('Time Series Analysis')
-filtered_df["weekly"] = filtered_df.index.to_period("W")
-linechart = pd.DataFrame(filtered_df.groupby(filtered_df["weekly"].dt.strftime("%b : %d"))["daily_visits"].sum()).reset_index()
+linechart = summary.over_time("W", daily_visits="sum").reset_index()
 fig2 = px.line(linechart, x="weekly", y="daily_visits", labels={"Patient": "count"}, height=500, width=1000, template="gridon")
+fig2.update_xaxes(tickformat=TICK_FORMATS["W"])
 st.plotly_chart(fig2, use_container_width=True)
 
+# 7-/28-day rolling averages per department over the chosen dates and filters; without other
+# filters they come from the cached rolling-window engine, without rescanning the history
+st.subheader("Rolling Trends by Department")
+show_rolling_trends("Hospital Performance", date1, date2, filtered_df, selections)
+
 # Analysis of least wait time by department
 st.subheader("Department with Least Wait Time")
 
-# Group by departments to find the one with the least average wait time
-wait_time_by_department = filtered_df.groupby('departments')['wait_time'].mean().reset_index()
+# Average wait time per department, from the cube groups; the least is a heap selection, not a full sort
+wait_time_by_department = summary.by('departments', wait_time='mean')['wait_time']
+least_wait = top_n(wait_time_by_department, 1, ascending=True)
 
-# Find department with the least wait time
-min_wait_time_department = wait_time_by_department.loc[wait_time_by_department['wait_time'].idxmin()]
+if least_wait.empty:
+    st.write("No departments match the selected filters.")
+else:
+    st.write(f"Department with the least average wait time: **{least_wait.index[0]}**")
+    st.write(f"Average wait time: **{least_wait.iloc[0]:.2f} minutes**")
+
+st.subheader("Department Leaderboard")
+show_leaderboard(wait_time_by_department, 'Average Wait Time (Minutes)', ascending=True)
+with st.expander("All-time leaderboard"):
+    # Running totals over the whole dataset, updated as new days are appended
+    all_time = load_department_leaderboard()
+    show_leaderboard(all_time.scores('daily_readmission'), 'Total Readmissions', ascending=True, value_format="%.0f")
 
-st.write(f"Department with the least average wait time: **{min_wait_time_department['departments']}**")
-st.write(f"Average wait time: **{min_wait_time_department['wait_time']:.2f} minutes**")
+wait_time_by_department = wait_time_by_department.reset_index()
 
 # Plotting wait times for all departments
 fig3 = px.bar(wait_time_by_department, x='departments', y='wait_time', title="Wait Time by Department",
@@ -153,3 +169,5 @@ fig3 = px.bar(wait_time_by_department, x='departments', y='wait_time', title="Wa
               color='wait_time', color_continuous_scale='Blues')
 
 st.plotly_chart(fig3, use_container_width=True)
+
+profile.finish()
@@ -1,23 +1,32 @@
 import streamlit as st
 import plotly.express as px
 import pandas as pd
+# First, so the shared data path imported below is timed from the very first run
+from profiler import profile_rerun
+from data_loader import date_bounds, load_dataset, pin_snapshot
+from filters import sidebar_filters
+from rollup import summarize
 
 def run():
     pass
 
+# Stage timings for this run; shown in the sidebar with ?debug=1
+profile = profile_rerun("Hospital Staff")
+
 st.title(" :bar_chart: Helpman Healthcare Interactive Dashboard For Hospital Staffs")
 st.markdown('<style>div.block-container{padding-top:2rem;}</style>', unsafe_allow_html=True)
 
 
-df = pd.read_csv("fake_healthcare_2.csv")
+# Columns used by this page; the page frame is a view of just these columns of the shared snapshot
+COLUMNS = [
+    'departments', 'employee_count', 'employee_resign'
+]
 
-# Ensure the date column is datetime and set as index
-df['date'] = pd.to_datetime(df['date'])
-df.set_index('date', inplace=True)
+# One snapshot for the whole rerun, so rows appended mid-run can't split the page frame from its filters and caches
+pin_snapshot()
 
-# Getting the min and max date
-startDate = df.index.min()
-endDate = df.index.max()
+# Getting the min and max date (the first and last rows of the date-sorted snapshot, without scanning it)
+startDate, endDate = date_bounds()
 
 st.sidebar.header("Filter by Date")
 date1 = st.sidebar.date_input("Start Date", startDate)
@@ -27,28 +36,28 @@ date2 = st.sidebar.date_input("End Date", endDate)
 date1 = pd.to_datetime(date1)
 date2 = pd.to_datetime(date2)
 
-# Filter the DataFrame based on selected dates
-df = df[(df.index >= date1) & (df.index <= date2)].copy()
+# Only the selected date range: a binary-searched slice of the snapshot, not a scan or a copy
+df = load_dataset(COLUMNS, date1, date2)
 
 st.sidebar.header("Choose your filter: ")
-# Create filter for Department
-department = st.sidebar.multiselect("Pick your department", df["departments"].unique())
-if not department:
-    filtered_df = df.copy()
-else:
-    filtered_df = df[df["departments"].isin(department)]
+# Every filter is applied as one combined mask; options only list values still present
+filtered_df, selections = sidebar_filters(df, date1, date2, [
+    ("departments", "Pick your department"),
+])
+
+# KPIs and department charts are answered from the pre-aggregated rollup cube
+summary = summarize(filtered_df, date1, date2, selections)
 
 # Overview Page
 #st.header("Overview")
-overview_df = filtered_df.copy()
 
 
 # Calculate summary metrics for employee data
 employee_metrics = {
-    "total_employee_count": overview_df['employee_count'].sum() if 'employee_count' in overview_df.columns else None,
-    "avg_employee_count": overview_df['employee_count'].mean() if 'employee_count' in overview_df.columns else None,
-    "total_employee_resign": overview_df['employee_resign'].sum() if 'employee_resign' in overview_df.columns else None,
-    "avg_employee_resign": overview_df['employee_resign'].mean() if 'employee_resign' in overview_df.columns else None,
+    "total_employee_count": summary.total('employee_count') if 'employee_count' in summary.metrics else None,
+    "avg_employee_count": summary.mean('employee_count') if 'employee_count' in summary.metrics else None,
+    "total_employee_resign": summary.total('employee_resign') if 'employee_resign' in summary.metrics else None,
+    "avg_employee_resign": summary.mean('employee_resign') if 'employee_resign' in summary.metrics else None,
 }
 
 # Display the metrics
@@ -68,10 +77,7 @@ with col4:
 
 
 # Department-based analysis for employee metrics
-department_employee_df = filtered_df.groupby('departments').agg({
-    'employee_count': 'sum',
-    'employee_resign': 'sum'
-}).reset_index()
+department_employee_df = summary.by('departments', employee_count='sum', employee_resign='sum').reset_index()
 
 # Creating columns for metrics visualization
 col1, col2 = st.columns(2)
@@ -95,11 +101,10 @@ with col2:
     st.plotly_chart(fig, use_container_width=True)
 
 # Time Series for Employee Data
-filtered_df["weekly"] = filtered_df.index.to_period("W").start_time
 st.subheader('Time Series Analysis of Employee Count')
 
 # Group by weekly and sum the employee_count
-linechart = pd.DataFrame(filtered_df.groupby("weekly")["employee_count"].sum()).reset_index()
+linechart = summary.over_time("W", employee_count="sum").reset_index()
 
 # Plot the line chart
 fig2 = px.line(linechart, x="weekly", y="employee_count", 
@@ -111,7 +116,7 @@ st.plotly_chart(fig2, use_container_width=True)
 
 
 # Ensure the day_of_week column exists
-filtered_df["day_of_week"] = filtered_df.index.day_name()
+filtered_df = filtered_df.assign(day_of_week=filtered_df.index.day_name())
 
 # Sidebar filter for Day of the Week
 st.sidebar.header("Filter by Day of the Week")
@@ -141,7 +146,7 @@ fig = px.bar(employee_data, x="day_of_week", y=["employee_count", "employee_resi
 st.plotly_chart(fig, use_container_width=True)
 
 # Group the data by departments and sum employee_count and employee_resign
-employee_distribution = filtered_df.groupby('departments')[['employee_count', 'employee_resign']].sum().reset_index()
+employee_distribution = filtered_df.groupby('departments', observed=True)[['employee_count', 'employee_resign']].sum().reset_index()
 
 # Plot the bar chart for employee_count and employee_resign across departments
 st.subheader('Employee Count and Resignations by Department')
@@ -153,3 +158,4 @@ fig = px.bar(employee_distribution, x='departments', y=['employee_count', 'emplo
 
 st.plotly_chart(fig, use_container_width=True)
 
+profile.finish()
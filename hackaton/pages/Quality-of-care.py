@@ -2,24 +2,35 @@
 import streamlit as st
 import plotly.express as px
 import pandas as pd
+# First, so the shared data path imported below is timed from the very first run
+from profiler import profile_rerun
+from data_loader import date_bounds, load_dataset, pin_snapshot
+from filters import sidebar_filters
+from rollup import summarize
+from timeseries import TICK_FORMATS
 
 def run():
     pass
+# Stage timings for this run; shown in the sidebar with ?debug=1
+profile = profile_rerun("Quality of Care")
+
 st.title(" :bar_chart: Helpman Healthcare Quality of care Interactive Dashboard")
 st.markdown('<style>div.block-container{padding-top:2rem;}</style>', unsafe_allow_html=True)
 
 st.write("Quality of care")
 
 
-df = pd.read_csv("fake_healthcare_2.csv")
+# Columns used by this page; the page frame is a view of just these columns of the shared snapshot
+COLUMNS = [
+    'departments', 'refer_reason', 'staff_patient_ratio', 'daily_visits', 'daily_admissions',
+    'patient_days', 'daily_revenue', 'beds_in_use', 'total_beds'
+]
 
-# Ensure the date column is datetime and set as index
-df['date'] = pd.to_datetime(df['date'])
-df.set_index('date', inplace=True)
+# One snapshot for the whole rerun, so rows appended mid-run can't split the page frame from its filters and caches
+pin_snapshot()
 
-# Getting the min and max date
-startDate = df.index.min()
-endDate = df.index.max()
+# Getting the min and max date (the first and last rows of the date-sorted snapshot, without scanning it)
+startDate, endDate = date_bounds()
 
 st.sidebar.header("Filter by Date")
 date1 = st.sidebar.date_input("Start Date", startDate)
@@ -29,42 +40,30 @@ date2 = st.sidebar.date_input("End Date", endDate)
 date1 = pd.to_datetime(date1)
 date2 = pd.to_datetime(date2)
 
-# Filter the DataFrame based on selected dates
-df = df[(df.index >= date1) & (df.index <= date2)].copy()
+# Only the selected date range: a binary-searched slice of the snapshot, not a scan or a copy
+df = load_dataset(COLUMNS, date1, date2)
 
 st.sidebar.header("Choose your filter: ")
-# Create filter for Department
-department = st.sidebar.multiselect("Pick your department", df["departments"].unique())
-if not department:
-    df2 = df.copy()
-else:
-    df2 = df[df["departments"].isin(department)]
-
-# Create filter for Refer Reason
-refer = st.sidebar.multiselect("Pick the refer reason", df2["refer_reason"].unique())
-if not refer:
-    df3 = df2.copy()
-else:
-    df3 = df2[df2["refer_reason"].isin(refer)]
-
-# Create filter for Staff to Patient Ratio
-staff_patient = st.sidebar.multiselect("Pick the Staff to Patient Ratio", df3["staff_patient_ratio"].unique())
-if not staff_patient:
-    filtered_df = df3.copy()
-else:
-    filtered_df = df3[df3["staff_patient_ratio"].isin(staff_patient)]
+# Every filter is applied as one combined mask; options only list values still present
+filtered_df, selections = sidebar_filters(df, date1, date2, [
+    ("departments", "Pick your department"),
+    ("refer_reason", "Pick the refer reason"),
+    ("staff_patient_ratio", "Pick the Staff to Patient Ratio"),
+])
+
+# KPIs and department charts are answered from the pre-aggregated rollup cube
+summary = summarize(filtered_df, date1, date2, selections)
 
 # Overview Page
 st.header("Overview")
-overview_df = filtered_df.copy()
 
 # Calculate summary metrics
-avg_length_of_stay = overview_df['patient_days'].mean()
-total_beds = overview_df['total_beds'].sum()
-occupied_beds = overview_df['beds_in_use'].sum()
+avg_length_of_stay = summary.mean('patient_days')
+total_beds = summary.total('total_beds')
+occupied_beds = summary.total('beds_in_use')
 bed_occupancy_rate = occupied_beds / total_beds * 100
-total_admissions = overview_df['daily_admissions'].sum()
-avg_treatment_cost = overview_df['daily_revenue'].mean()
+total_admissions = summary.total('daily_admissions')
+avg_treatment_cost = summary.mean('daily_revenue')
 
 # Create a single row for the overview charts
 col1, col2, col3, col4, col5 = st.columns(5)
@@ -86,17 +85,18 @@ with col5:
 
 # Additional overview charts
 st.subheader("Department Distribution of Admitted Patients")
-admissions_by_department = overview_df.groupby('departments')['daily_admissions'].sum().reset_index()
+admissions_by_department = summary.by('departments', daily_admissions='sum').reset_index()
 fig = px.bar(admissions_by_department, x='departments', y='daily_admissions', title='Admissions by Department')
 st.plotly_chart(fig, use_container_width=True)
 
 st.subheader("Average Treatment Costs")
-fig = px.bar(overview_df, x='departments', y='daily_revenue', title='Average Treatment Costs by Department')
+revenue_by_department = summary.by('departments', daily_revenue='sum').reset_index()
+fig = px.bar(revenue_by_department, x='departments', y='daily_revenue', title='Average Treatment Costs by Department')
 st.plotly_chart(fig, use_container_width=True)
 
 # Detailed Pages
 st.header("Detailed Analysis")
-department_df = filtered_df.groupby('departments').agg({'beds_in_use': 'sum', 'total_beds': 'first'})
+department_df = summary.by('departments', beds_in_use='sum', total_beds='first')
 
 col1, col2 = st.columns(2)
 
@@ -114,11 +114,7 @@ with col2:
                  template="seaborn", color='beds_in_use', color_continuous_scale='Viridis')
     st.plotly_chart(fig, use_container_width=True)
 
-department_df2 = filtered_df.groupby('departments').agg({
-    'daily_visits': 'sum',
-    'daily_admissions': 'sum',
-    'patient_days': 'sum'
-}).reset_index()
+department_df2 = summary.by('departments', daily_visits='sum', daily_admissions='sum', patient_days='sum').reset_index()
 department_df_melted = department_df2.melt(id_vars='departments',
                                            value_vars=['daily_visits', 'daily_admissions', 'patient_days'],
                                            var_name='Metric', value_name='Count')
@@ -137,8 +133,10 @@ with col2:
                  hole=0.5)
     st.plotly_chart(fig, use_container_width=True)
 
-filtered_df["weekly"] = filtered_df.index.to_period("W")
 st.subheader('Time Series Analysis')
-linechart = pd.DataFrame(filtered_df.groupby(filtered_df["weekly"].dt.strftime("%b : %d"))["daily_visits"].sum()).reset_index()
+linechart = summary.over_time("W", daily_visits="sum").reset_index()
 fig2 = px.line(linechart, x="weekly", y="daily_visits", labels={"Patient": "count"}, height=500, width=1000, template="gridon")
+fig2.update_xaxes(tickformat=TICK_FORMATS["W"])
 st.plotly_chart(fig2, use_container_width=True)
+
+profile.finish()
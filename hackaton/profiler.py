@@ -0,0 +1,329 @@
+"""Per-rerun stage timings for the dashboard pages.
+
+Importing this module routes the shared data path through stage timers:
+
+    parse      CSV parsing while ingesting the dataset
+    load       data_loader.pin_snapshot / load_dataset / date_bounds
+    filter     filters.sidebar_filters (the sidebar cascade)
+    groupby    rollup summaries, cube, doctor index and rolling-window queries
+    figure     plotly.express figure construction
+    serialize  st.plotly_chart (figure to JSON and into the page)
+    other      everything else in the script run
+
+Pages call `profile_rerun` near the top and `finish()` at the end. Timing is
+always on (it costs a clock read per call); with the debug flag set
+(``?debug=1`` or DASHBOARD_DEBUG=1) the breakdown is shown in the sidebar and
+memory is traced too, by one rerun at a time. Set PROFILE_EXPORT to a file to
+keep aggregated timings there, as JSON or, for a ``.prom`` file, in the
+Prometheus text format (e.g. for the node exporter's textfile collector).
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+from streamlit.delta_generator import DeltaGenerator
+
+import data_loader
+import doctors
+import filters
+import leaderboard
+import rolling
+import rollup
+
+STAGES = ["parse", "load", "filter", "groupby", "figure", "serialize"]
+
+# Where aggregated timings are exported ("" to disable); .prom for Prometheus text, anything else JSON
+PROFILE_EXPORT = os.getenv("PROFILE_EXPORT", "")
+
+# Minimum seconds between two exports, so busy sessions don't rewrite the file on every rerun
+EXPORT_INTERVAL_SECONDS = 10.0
+
+# Environment variable that turns the debug flag on for every session
+DEBUG_ENV = "DASHBOARD_DEBUG"
+
+_local = threading.local()
+_active = {}
+_stats_lock = threading.Lock()
+_stats = {}
+_last = [None]
+_last_export = [0.0]
+_tracing = [0]
+
+
+def debug_enabled():
+    """True when the debug flag is set, through the environment or the page URL."""
+    if os.getenv(DEBUG_ENV, "") not in ("", "0"):
+        return True
+    try:
+        return st.query_params.get("debug", "0") not in ("", "0")
+    except Exception:
+        # No script run context (e.g. called from a plain Python process)
+        return False
+
+
+class RerunProfile:
+    """Timings of one script run, split by stage.
+
+    A stage's time excludes the stages nested in it (a figure build that queries
+    the cube counts the query as groupby). With `trace_memory`, each stage also
+    records the peak bytes it allocated above its starting point (temporary
+    copies included) and the net Python memory blocks it left allocated.
+
+    tracemalloc's peak is process-wide and every stage resets it, so only one
+    run traces memory at a time (see `profile_rerun`). Its figures still
+    include whatever other threads allocate meanwhile, so they are exact only
+    on an otherwise idle server.
+    """
+
+    def __init__(self, page, trace_memory=False):
+        self.page = page
+        self.trace_memory = trace_memory
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        self.alloc_bytes = dict.fromkeys(STAGES, 0)
+        self.blocks = dict.fromkeys(STAGES, 0)
+        self.total = None
+        self._stack = []
+        self._started = time.perf_counter()
+
+    @property
+    def current_stage(self):
+        """Innermost stage running right now, or None (safe to read from other threads)."""
+        stack = self._stack
+        return stack[-1][0] if stack else None
+
+    def enter(self, stage):
+        frame = [stage, time.perf_counter(), 0.0, 0, 0, 0, 0]
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][4] = max(self._stack[-1][4], peak)
+            tracemalloc.reset_peak()
+            # start bytes, peak bytes, start blocks, nested blocks
+            frame[3:] = [current, current, sys.getallocatedblocks(), 0]
+        self._stack.append(frame)
+
+    def exit(self):
+        stage, started, nested, start_bytes, peak, start_blocks, nested_blocks = self._stack.pop()
+        elapsed = time.perf_counter() - started
+        self.seconds[stage] += elapsed - nested
+        self.calls[stage] += 1
+        blocks = 0
+        if self.trace_memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            self.alloc_bytes[stage] = max(self.alloc_bytes[stage], peak - start_bytes)
+            blocks = sys.getallocatedblocks() - start_blocks
+            self.blocks[stage] += blocks - nested_blocks
+        if self._stack:
+            parent = self._stack[-1]
+            parent[2] += elapsed
+            parent[4] = max(parent[4], peak)
+            parent[6] += blocks
+
+    def finish(self):
+        """End the run: record it, export if configured, and show the breakdown in debug mode."""
+        if self.total is not None:
+            return
+        self.total = time.perf_counter() - self._started
+        if getattr(_local, "profile", None) is self:
+            _local.profile = None
+        _active.pop(threading.get_ident(), None)
+        if self.trace_memory:
+            _stop_tracing()
+        _record(self)
+        if PROFILE_EXPORT:
+            export(PROFILE_EXPORT)
+        if debug_enabled():
+            with st.sidebar.expander("Rerun timings"):
+                st.dataframe(self.frame(), use_container_width=True)
+                st.caption(f"{self.total * 1000:.1f} ms in total")
+                if not self.trace_memory:
+                    st.caption("Memory not traced: another debug rerun was tracing it")
+
+    @property
+    def other_seconds(self):
+        total = self.total if self.total is not None else time.perf_counter() - self._started
+        return max(0.0, total - sum(self.seconds.values()))
+
+    def frame(self):
+        """The breakdown as a DataFrame, one row per stage that ran."""
+        rows = {
+            stage: {"ms": self.seconds[stage] * 1000, "calls": self.calls[stage],
+                    "alloc_kb": self.alloc_bytes[stage] / 1024, "blocks": self.blocks[stage]}
+            for stage in STAGES if self.calls[stage]
+        }
+        rows["other"] = {"ms": self.other_seconds * 1000, "calls": 1, "alloc_kb": 0.0, "blocks": 0}
+        frame = pd.DataFrame.from_dict(rows, orient="index")
+        return frame if self.trace_memory else frame[["ms", "calls"]]
+
+
+def _start_tracing():
+    # Tracing and its peak are process-wide, so one rerun owns them at a time; False if another does
+    with _stats_lock:
+        if _tracing[0]:
+            return False
+        _tracing[0] = 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return True
+
+
+def _stop_tracing():
+    with _stats_lock:
+        _tracing[0] -= 1
+        if _tracing[0] == 0:
+            tracemalloc.stop()
+
+
+def _abandon(ident, profile):
+    # A run that never reached finish() (st.stop, a rerun or an error) is dropped unrecorded
+    profile.total = 0.0
+    _active.pop(ident, None)
+    if profile.trace_memory:
+        _stop_tracing()
+
+
+def profile_rerun(page):
+    """Start timing this script run of `page` and return its RerunProfile."""
+    previous = getattr(_local, "profile", None)
+    if previous is not None and previous.total is None:
+        _abandon(threading.get_ident(), previous)
+    running = {thread.ident for thread in threading.enumerate()}
+    for ident, profile in list(_active.items()):
+        if ident not in running:
+            _abandon(ident, profile)
+    # A debug rerun overlapping one that is tracing memory gets timings only
+    trace_memory = debug_enabled() and _start_tracing()
+    profile = RerunProfile(page, trace_memory=trace_memory)
+    _local.profile = profile
+    _active[threading.get_ident()] = profile
+    return profile
+
+
+def active_profiles():
+    """Profiles of the script runs in progress, for samplers running on other threads."""
+    return list(_active.values())
+
+
+def last_profile():
+    """The most recently finished profile in this process."""
+    return _last[0]
+
+
+def _record(profile):
+    with _stats_lock:
+        _last[0] = profile
+        seconds = dict(profile.seconds, other=profile.other_seconds)
+        calls = dict(profile.calls, other=1)
+        for stage, value in seconds.items():
+            if not calls[stage]:
+                continue
+            entry = _stats.setdefault((profile.page, stage), {"reruns": 0, "calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["reruns"] += 1
+            entry["calls"] += calls[stage]
+            entry["seconds"] += value
+            entry["max_seconds"] = max(entry["max_seconds"], value)
+
+
+def stats():
+    """Aggregated timings: {(page, stage): {reruns, calls, seconds, max_seconds}}."""
+    with _stats_lock:
+        return {key: dict(entry) for key, entry in _stats.items()}
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    """Aggregated timings in the Prometheus text exposition format."""
+    metrics = [
+        ("dashboard_stage_seconds_total", "counter", "seconds", "Time spent in each stage of a page's reruns."),
+        ("dashboard_stage_calls_total", "counter", "calls", "Calls into each stage of a page's reruns."),
+        ("dashboard_stage_reruns_total", "counter", "reruns", "Reruns of each page that ran the stage."),
+        ("dashboard_stage_max_seconds", "gauge", "max_seconds", "Longest time a single rerun spent in the stage."),
+    ]
+    aggregated = sorted(stats().items())
+    lines = []
+    for name, kind, field, description in metrics:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        lines += [
+            f'{name}{{page="{_label(page)}",stage="{_label(stage)}"}} {entry[field]}'
+            for (page, stage), entry in aggregated
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def export(path, force=False):
+    """Write the aggregated timings to `path` (.prom for Prometheus text, otherwise JSON)."""
+    now = time.monotonic()
+    with _stats_lock:
+        if not force and now - _last_export[0] < EXPORT_INTERVAL_SECONDS:
+            return
+        _last_export[0] = now
+    if path.endswith(".prom"):
+        text = prometheus_text()
+    else:
+        text = json.dumps([{"page": page, "stage": stage, **entry} for (page, stage), entry in sorted(stats().items())],
+                          indent=2)
+    # Written whole and swapped in, so a scraper never reads half a file
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as out:
+        out.write(text)
+    os.replace(tmp_path, path)
+
+
+def _timed(stage, function):
+    def timed(*args, **kwargs):
+        profile = getattr(_local, "profile", None)
+        if profile is None or profile.total is not None:
+            return function(*args, **kwargs)
+        profile.enter(stage)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.exit()
+
+    timed.__wrapped__ = function
+    timed.profiled_stage = stage
+    timed.__name__ = getattr(function, "__name__", stage)
+    timed.__doc__ = getattr(function, "__doc__", None)
+    return timed
+
+
+def _instrument():
+    # Wrap the shared entry points in place; pages import them by name on every
+    # run, so they pick up the wrappers as long as this module was imported first
+    for module, stage, names in [
+        (data_loader, "parse", ["_parse_csv"]),
+        (data_loader, "load", ["pin_snapshot", "load_dataset", "date_bounds"]),
+        (filters, "filter", ["sidebar_filters"]),
+        (rollup, "groupby", ["summarize", "load_cube"]),
+        (doctors, "groupby", ["load_doctor_index", "doctor_index"]),
+        (leaderboard, "groupby", ["top_n", "load_department_leaderboard"]),
+        (rolling, "groupby", ["load_rolling", "rolling_engine"]),
+        (px, "figure", ["bar", "line", "pie", "scatter", "histogram", "area", "box"]),
+        (st, "serialize", ["plotly_chart"]),
+        (DeltaGenerator, "serialize", ["plotly_chart"]),
+    ]:
+        for name in names:
+            function = getattr(module, name)
+            if not hasattr(function, "profiled_stage"):
+                setattr(module, name, _timed(stage, function))
+    for name in ["total", "mean", "min", "max", "first", "by", "over_time", "counts_over_time"]:
+        function = getattr(rollup.CubeView, name)
+        if not hasattr(function, "profiled_stage"):
+            setattr(rollup.CubeView, name, _timed("groupby", function))
+    for cls, name in [(doctors.DoctorIndex, "summary"), (doctors.DoctorIndex, "rank"), (rolling.RollingEngine, "window")]:
+        function = getattr(cls, name)
+        if not hasattr(function, "profiled_stage"):
+            setattr(cls, name, _timed("groupby", function))
+
+
+_instrument()
@@ -0,0 +1,167 @@
+import re
+
+import pandas as pd
+
+from data_loader import DATA_FILE, FLOAT_COLUMNS
+from rollup import load_cube
+
+# Words that pick the aggregate, checked in this order
+AGGREGATE_WORDS = [
+    ("mean", ("average", "avg", "mean")),
+    ("sum", ("total", "sum")),
+    ("max", ("maximum", "max", "highest", "peak")),
+    ("min", ("minimum", "min", "lowest")),
+]
+
+# Ranking by a metric without an aggregate word averages rates and sums counts
+MEAN_BY_DEFAULT = [*FLOAT_COLUMNS, "wait_time"]
+
+# Cube dimensions a question can rank by, and the words that name them
+GROUP_WORDS = {
+    "departments": ("departments", "department", "depts", "dept"),
+    "refer_reason": ("refer reasons", "refer reason", "reasons", "reason"),
+    "staff_patient_ratio": ("staff patient ratios", "staff patient ratio", "ratios", "ratio"),
+}
+
+_DATE = r"(\d{4}-\d{2}-\d{2})"
+
+
+class DatasetQuery:
+    """A parsed dataset question: aggregate `metric` over a date range and departments.
+
+    With `top` set it ranks the values of `group` instead of returning a
+    single number.
+    """
+
+    def __init__(self, metric, how, departments=(), start=None, end=None, period=None,
+                 group=None, top=None, ascending=False):
+        self.metric = metric
+        self.how = how
+        self.departments = list(departments)
+        self.start = start
+        self.end = end
+        self.period = period
+        self.group = group
+        self.top = top
+        self.ascending = ascending
+
+    def describe(self):
+        """Human-readable scope, e.g. "for surgery last week"."""
+        parts = []
+        if self.departments:
+            parts.append("for " + ", ".join(self.departments))
+        if self.period:
+            parts.append(self.period)
+        return " ".join(parts)
+
+
+def _normalize(text):
+    # Lowercase, underscores as spaces, and single spaces between words
+    return " " + " ".join(text.lower().replace("_", " ").split()) + " "
+
+
+def _mentions(text, name):
+    return re.search(r"(?<![\w])" + re.escape(_normalize(name).strip()) + r"(?![\w])", text) is not None
+
+
+def _period(text, latest):
+    # (start, end, label) for the date phrase in `text`; relative phrases count back from the latest date in the data
+    dates = re.findall(_DATE, text)
+    if len(dates) >= 2:
+        start, end = sorted(pd.Timestamp(date) for date in dates[:2])
+        return start, end, f"from {start.date()} to {end.date()}"
+    if dates:
+        day = pd.Timestamp(dates[0])
+        return day, day, f"on {day.date()}"
+    match = re.search(r" last (\d+) (day|week|month)s? ", text)
+    if match:
+        count, unit = int(match.group(1)), match.group(2)
+        start = {
+            "day": latest - pd.Timedelta(days=count - 1),
+            "week": latest - pd.Timedelta(days=7 * count - 1),
+            "month": latest - pd.DateOffset(months=count) + pd.Timedelta(days=1),
+        }[unit]
+        return start, latest, f"over the last {count} {unit}s"
+    week = latest - pd.Timedelta(days=latest.weekday())
+    month, year = latest.replace(day=1), latest.replace(month=1, day=1)
+    phrases = [
+        (" today ", latest, latest),
+        (" yesterday ", latest - pd.Timedelta(days=1), latest - pd.Timedelta(days=1)),
+        (" last week ", week - pd.Timedelta(days=7), week - pd.Timedelta(days=1)),
+        (" this week ", week, latest),
+        (" last month ", month - pd.DateOffset(months=1), month - pd.Timedelta(days=1)),
+        (" this month ", month, latest),
+        (" last year ", year - pd.DateOffset(years=1), year - pd.Timedelta(days=1)),
+        (" this year ", year, latest),
+    ]
+    for phrase, start, end in phrases:
+        if phrase in text:
+            return start, end, phrase.strip()
+    return None, None, None
+
+
+def parse_query(question, metrics, departments, latest):
+    """Parse `question` into a DatasetQuery, or None if it isn't about a known metric.
+
+    `metrics` and `departments` are the names the question may refer to and
+    `latest` anchors relative dates ("last week") to the end of the data.
+    """
+    text = _normalize(question)
+    # Longest names first, so "daily admissions" wins over "admissions"
+    metric = next((m for m in sorted(metrics, key=len, reverse=True) if _mentions(text, m)), None)
+    if metric is None:
+        return None
+    how = next((how for how, words in AGGREGATE_WORDS if any(_mentions(text, word) for word in words)), None)
+    start, end, period = _period(text, latest)
+    selected = [department for department in departments if _mentions(text, department)]
+
+    ranking = re.search(r" (top|bottom|best|worst|highest|lowest) (\d+) ", text)
+    if ranking:
+        group = next(
+            (dim for dim, words in GROUP_WORDS.items() if any(_mentions(text, word) for word in words)),
+            "departments",
+        )
+        if how in ("max", "min"):
+            # "highest 3 departments by ..." names the ranking, not the aggregate
+            how = None
+        return DatasetQuery(
+            metric, how or ("mean" if metric in MEAN_BY_DEFAULT else "sum"), selected, start, end, period,
+            group=group, top=int(ranking.group(2)), ascending=ranking.group(1) in ("bottom", "worst", "lowest"),
+        )
+    if how is None:
+        return None
+    return DatasetQuery(metric, how, selected, start, end, period)
+
+
+def _format(value):
+    if pd.isna(value):
+        return "no data"
+    return f"{value:,.0f}" if float(value).is_integer() else f"{value:,.2f}"
+
+
+def run_query(query, cube):
+    """Answer `query` from the rollup cube and return the reply text."""
+    view = cube.view(query.start, query.end, {"departments": query.departments} if query.departments else None)
+    scope = query.describe()
+    scope = f" {scope}" if scope else ""
+    label = {"mean": "average", "sum": "total", "max": "maximum", "min": "minimum"}[query.how]
+    if view.empty:
+        return f"There is no data{scope}."
+    if query.top is None:
+        value = getattr(view, {"sum": "total"}.get(query.how, query.how))(query.metric)
+        return f"The {label} {query.metric}{scope} is {_format(value)}."
+    ranked = view.by(query.group, **{query.metric: query.how})[query.metric].dropna()
+    ranked = ranked.sort_values(ascending=query.ascending).head(query.top)
+    which = "Bottom" if query.ascending else "Top"
+    items = ", ".join(f"{name} ({_format(value)})" for name, value in ranked.items())
+    return f"{which} {len(ranked)} {GROUP_WORDS[query.group][0]} by {label} {query.metric}{scope}: {items}."
+
+
+def answer_question(question, path=DATA_FILE):
+    """Answer `question` from the precomputed aggregates, or return None if it can't be."""
+    cube = load_cube(path)
+    if cube.frame.empty:
+        return None
+    departments = cube.frame["departments"].cat.categories if "departments" in cube.frame else []
+    query = parse_query(question, cube.metrics, departments, cube.frame.index.max())
+    return None if query is None else run_query(query, cube)
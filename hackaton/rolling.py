@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from charts import cached_figure, filter_state
+from data_loader import DATA_FILE
+from incremental import grow_codes, shared_loader
+from timeseries import FREQUENCIES, MAX_POINTS, TICK_FORMATS
+
+# Operational KPIs with rolling views, each a per-row rate or time averaged over the window
+ROLLING_METRICS = ["occupancy_rate", "wait_time", "readmission_rate", "bed_turnover"]
+
+# Window lengths offered on the pages, in days
+WINDOWS = [7, 28]
+
+# Sidebar filters the shared engine can answer; any other selection needs the filtered rows
+ROLLING_FILTERS = ["departments"]
+
+
+class RollingEngine:
+    """Rolling-window sums and means per department over a dense day grid.
+
+    Each metric keeps its daily sum per (day, department) and the cumulative
+    sums of those down the days, plus a row count the same way. A window of any
+    length ending on any day is then one subtraction of two cumulative rows, and
+    appending a day only extends the cumulative sums from that day on, so new
+    days cost O(departments) each however long the history is.
+    """
+
+    def __init__(self, df, dimension="departments", metrics=ROLLING_METRICS):
+        self.dimension = dimension
+        self.metrics = [metric for metric in metrics if metric in df.columns]
+        self.keys = pd.Index([], dtype=object)
+        # Day number (days since 1970) of the first row of the grid
+        self.first_day = None
+        self.rows = 0
+        # Days in the grid; the arrays below keep spare capacity past it, so a new day is written in place
+        self.days = 0
+        names = ["rows", *self.metrics]
+        self._daily = {name: np.zeros((0, 0)) for name in names}
+        # One row longer than the grid, starting at 0: window sums are differences of two rows
+        self._cumulative = {name: np.zeros((1, 0)) for name in names}
+        self.extend(df)
+
+    def _reserve(self, height, width):
+        # Grow every array to hold `height` days and `width` keys, doubling so appends stay amortized O(1)
+        rows, columns = self._daily["rows"].shape
+        if height <= rows and width <= columns:
+            return
+        rows, columns = max(height, 2 * rows), max(width, 2 * columns)
+        for name in self._daily:
+            daily = np.zeros((rows, columns))
+            daily[:self.days, :self._daily[name].shape[1]] = self._daily[name][:self.days]
+            cumulative = np.zeros((rows + 1, columns))
+            cumulative[:self.days + 1, :self._cumulative[name].shape[1]] = self._cumulative[name][:self.days + 1]
+            self._daily[name], self._cumulative[name] = daily, cumulative
+
+    def extend(self, df):
+        """Fold rows appended after the ones already counted (`df` holds only the new rows, in date order)."""
+        if df.empty:
+            return
+        self.keys, codes = grow_codes(self.keys, df[self.dimension])
+        days = df.index.to_numpy().astype("datetime64[D]").astype(np.int64)
+        if self.first_day is None:
+            self.first_day = int(days[0])
+        days = days - self.first_day
+        if days[0] < self.days - 1:
+            raise ValueError("rows must not be dated before the last day already counted")
+        self.rows += len(df)
+        known = codes >= 0
+        days, codes = days[known], codes[known]
+        if not len(days):
+            return
+        # Only days from the first new one onwards change
+        changed, height = int(days[0]), max(self.days, int(days[-1]) + 1)
+        width = len(self.keys)
+        self._reserve(height, width)
+        cells = (days - changed) * width + codes
+        for name in self._daily:
+            added = (np.ones(len(cells)) if name == "rows"
+                     else df[name].to_numpy(dtype=np.float64)[known])
+            daily, cumulative = self._daily[name], self._cumulative[name]
+            daily[changed:height, :width] += np.bincount(
+                cells, weights=added, minlength=(height - changed) * width
+            ).reshape(height - changed, width)
+            cumulative[changed + 1:height + 1] = cumulative[changed] + np.cumsum(daily[changed:height], axis=0)
+        # Advanced last, so `window` never reads days that are still being written
+        self.days = height
+
+    def window(self, days, metric, how="mean", start=None, end=None, keys=None):
+        """Rolling `days`-day sum or mean of `metric` for each day in [start, end], one column per key.
+
+        Means are per row over the window (the same weighting as the rollup
+        cube's means). Days whose window reaches back before the first day of
+        data, or holds no rows, are NaN.
+        """
+        if how not in ("sum", "mean"):
+            raise ValueError(f"unsupported aggregation: {how}")
+        keys = self.keys if keys is None else pd.Index([key for key in keys if key in self.keys])
+        if self.first_day is None or not len(keys):
+            return pd.DataFrame(index=pd.DatetimeIndex([], name=FREQUENCIES["D"]), columns=keys, dtype=float)
+        columns = self.keys.get_indexer(keys)
+        first = 0 if start is None else pd.Timestamp(start).to_datetime64().astype("datetime64[D]").astype(np.int64) - self.first_day
+        last = self.days - 1 if end is None else pd.Timestamp(end).to_datetime64().astype("datetime64[D]").astype(np.int64) - self.first_day
+        ends = np.arange(max(first, 0), min(last, self.days - 1) + 1) + 1
+        starts = ends - days
+        partial = starts < 0
+        starts = np.maximum(starts, 0)
+
+        def windowed(name):
+            cumulative = self._cumulative[name]
+            return cumulative[np.ix_(ends, columns)] - cumulative[np.ix_(starts, columns)]
+
+        values = windowed(metric)
+        if how == "mean":
+            rows = windowed("rows")
+            values = np.divide(values, rows, out=np.full(values.shape, np.nan), where=rows > 0)
+        values[partial] = np.nan
+        index = pd.DatetimeIndex((ends - 1 + self.first_day).astype("datetime64[D]"), name=FREQUENCIES["D"])
+        return pd.DataFrame(values, index=index, columns=pd.Index(keys, name=self.dimension))
+
+
+# load_rolling(path=DATA_FILE): the rolling-window engine for the dataset at `path`, kept current as rows are appended
+load_rolling = shared_loader(RollingEngine, columns=["departments", *ROLLING_METRICS],
+                             show_spinner="Computing rolling windows...")
+
+
+def rolling_engine(rows, selections=None, path=DATA_FILE):
+    """Return a rolling-window engine for the current page filters.
+
+    Served from the shared engine when only departments are selected;
+    otherwise (e.g. a refer_reason filter) the already filtered `rows` are
+    rolled up instead, like `rollup.summarize` does for the cube. Windows
+    reaching back before the first of those rows are then NaN.
+    """
+    selections = {column: values for column, values in (selections or {}).items() if values}
+    if all(column in ROLLING_FILTERS for column in selections):
+        return load_rolling(path)
+    return RollingEngine(rows)
+
+
+def rolling_line(frame, metric, days):
+    """Line chart of a `RollingEngine.window` frame, one line per department.
+
+    Dates are thinned evenly to at most MAX_POINTS per line; a rolling mean is
+    already smooth, so no peaks are lost that the window hadn't averaged out.
+    """
+    step = max(1, -(-len(frame) // MAX_POINTS))
+    long = frame.iloc[::step].reset_index().melt(id_vars=FREQUENCIES["D"], value_name=metric)
+    fig = px.line(long, x=FREQUENCIES["D"], y=metric, color=frame.columns.name,
+                  title=f"{metric.replace('_', ' ').title()}, {days}-day rolling average")
+    fig.update_xaxes(tickformat=TICK_FORMATS["D"])
+    return fig
+
+
+def show_rolling_trends(page, start, end, rows, selections=None):
+    """Render a window picker and a rolling-average chart per ROLLING_METRICS column of `rows`.
+
+    `rows` are the page's filtered rows and `selections` its sidebar filters;
+    one line per selected department (all when none are selected).
+    """
+    days = st.radio("Rolling window (days)", WINDOWS, horizontal=True, key=f"{page}_rolling_window")
+    selections = selections or {}
+    departments = selections.get("departments") or None
+    state = filter_state(start, end, selections, window=[days])
+    # Built on the first figure cache miss only: the fallback engine costs a pass over `rows`
+    engine = []
+
+    def build(metric):
+        if not engine:
+            engine.append(rolling_engine(rows, selections))
+        return rolling_line(engine[0].window(days, metric, "mean", start, end, departments), metric, days)
+
+    for metric in ROLLING_METRICS:
+        if metric in rows.columns:
+            fig = cached_figure(page, f"{metric}_rolling", state, lambda: build(metric))
+            st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import DATA_FILE, FLOAT_COLUMNS, INT_COLUMNS, date_slice
+from filters import FilterEngine
+from incremental import shared_loader
+from timeseries import FREQUENCIES, bucket_keys, bucket_starts, time_buckets
+
+# Dimensions the cube is keyed by, in addition to the date
+DIMENSIONS = ["departments", "refer_reason", "staff_patient_ratio"]
+
+# Per-metric aggregates kept in the cube
+AGGREGATES = ["sum", "min", "max", "first"]
+
+
+class RollupCube:
+    """Pre-aggregated (date, department, refer_reason, staff_patient_ratio) cube.
+
+    Every numeric metric keeps its sum, min, max and first value per group, plus
+    a row count, so KPI cards and per-department charts can be answered from the
+    distinct groups instead of the raw rows.
+    """
+
+    def __init__(self, df, dimensions=DIMENSIONS):
+        self.dimensions = [dim for dim in dimensions if dim in df.columns]
+        self.metrics = [col for col in INT_COLUMNS + FLOAT_COLUMNS if col in df.columns]
+        self.frame = self._build(df)
+        self.engine = FilterEngine(self.frame)
+        # Number of raw rows rolled up so far
+        self.rows = len(df)
+
+    def _build(self, df):
+        # sort=False keeps groups in order of first appearance, i.e. date order, which
+        # also makes "first" across groups match "first" across the raw rows
+        grouped = df.groupby(["date", *self.dimensions], observed=True, sort=False)
+        parts = {"rows": grouped.size()}
+        for metric in self.metrics:
+            values = grouped[metric]
+            # Sums are widened so adding up many groups doesn't overflow or lose precision
+            parts[f"{metric}_sum"] = values.sum().astype(
+                np.float64 if metric in FLOAT_COLUMNS else np.int64
+            )
+            parts[f"{metric}_min"] = values.min()
+            parts[f"{metric}_max"] = values.max()
+            parts[f"{metric}_first"] = values.first()
+        frame = pd.DataFrame(parts)
+        frame = frame.reset_index(level=self.dimensions) if self.dimensions else frame
+        frame.index.name = "date"
+        return frame
+
+    def extend(self, df):
+        """Fold newer rows into the cube.
+
+        `df` must hold every raw row from its first date onwards, including rows
+        already in the cube for that date: groups from that date on are rebuilt
+        from `df`, everything before it is left as is.
+        """
+        if df.empty:
+            return
+        boundary = self.frame.index.searchsorted(df.index[0], side="left")
+        kept = self.frame.iloc[:boundary]
+        added = self._build(df)
+        for dim in self.dimensions:
+            # New categories (e.g. a new department) are added after the existing ones
+            categories = kept[dim].cat.categories.append(
+                added[dim].cat.categories.difference(kept[dim].cat.categories, sort=False)
+            )
+            kept = kept.assign(**{dim: kept[dim].cat.set_categories(categories)})
+            added = added.assign(**{dim: added[dim].cat.set_categories(categories)})
+        frame = pd.concat([kept, added])
+        rows = self.rows - int(self.frame["rows"].iloc[boundary:].sum()) + len(df)
+        # Swap the engine last: `view` only goes through it, so readers never see a half-updated cube
+        self.frame, self.rows = frame, rows
+        self.engine = FilterEngine(frame)
+
+    def view(self, start=None, end=None, selections=None):
+        """Cube groups for the rows between `start` and `end` that match `selections`."""
+        cascade = self.engine.cascade(start, end)
+        for column, values in (selections or {}).items():
+            cascade.select(column, values)
+        return CubeView(cascade.frame(), self.metrics)
+
+
+class CubeView:
+    """Filtered slice of a cube with the row-level aggregations the pages need."""
+
+    def __init__(self, frame, metrics):
+        self.frame = frame
+        self.metrics = metrics
+
+    @property
+    def empty(self):
+        return self.frame.empty
+
+    def total(self, metric):
+        return self.frame[f"{metric}_sum"].sum()
+
+    def mean(self, metric):
+        rows = self.frame["rows"].sum()
+        return self.total(metric) / rows if rows else np.nan
+
+    def min(self, metric):
+        return self.frame[f"{metric}_min"].min()
+
+    def max(self, metric):
+        return self.frame[f"{metric}_max"].max()
+
+    def first(self, metric):
+        return self.frame[f"{metric}_first"].iloc[0] if len(self.frame) else np.nan
+
+    def by(self, dimension, **aggs):
+        """Aggregate per `dimension`, e.g. ``by("departments", beds_in_use="sum", total_beds="first")``.
+
+        Supported aggregations are sum, mean, min, max, first and count.
+        """
+        grouped = self.frame.groupby(dimension, observed=True)
+        columns = {}
+        for metric, how in aggs.items():
+            if how == "mean":
+                columns[metric] = grouped[f"{metric}_sum"].sum() / grouped["rows"].sum()
+            elif how == "count":
+                columns[metric] = grouped["rows"].sum()
+            elif how in AGGREGATES:
+                columns[metric] = getattr(grouped[f"{metric}_{how}"], how)()
+            else:
+                raise ValueError(f"unsupported aggregation: {how}")
+        result = pd.DataFrame(columns)
+        result.index.name = dimension
+        return result
+
+    def over_time(self, freq="W", **aggs):
+        """Aggregate per time bucket, e.g. ``over_time("W", daily_visits="sum")``.
+
+        Supported aggregations are sum, mean and count; see `timeseries` for the
+        bucket sizes. Buckets come back in chronological order.
+        """
+        summed = [f"{metric}_sum" for metric, how in aggs.items() if how in ("sum", "mean")]
+        sums = time_buckets(self.frame, ["rows", *summed], freq)
+        columns = {}
+        for metric, how in aggs.items():
+            if how == "sum":
+                columns[metric] = sums[f"{metric}_sum"]
+            elif how == "mean":
+                columns[metric] = sums[f"{metric}_sum"] / sums["rows"]
+            elif how == "count":
+                columns[metric] = sums["rows"]
+            else:
+                raise ValueError(f"unsupported aggregation: {how}")
+        return pd.DataFrame(columns, index=sums.index)
+
+    def counts_over_time(self, dimension, freq="W"):
+        """Row count per (time bucket, `dimension` value), as a long frame."""
+        keys = bucket_keys(self.frame.index, freq)
+        counts = self.frame.groupby([keys, self.frame[dimension].to_numpy()])["rows"].sum()
+        counts.index = counts.index.set_levels(bucket_starts(counts.index.levels[0], freq), level=0)
+        counts.index.names = [FREQUENCIES[freq], dimension]
+        return counts.reset_index()
+
+
+def _from_first_new_date(df, cube, path):
+    # Appended rows are never dated before the rows already in this generation,
+    # so only the groups from the first new date onwards need rebuilding
+    return df.iloc[date_slice(df.index[cube.rows], None, path)]
+
+
+# load_cube(path=DATA_FILE): the cube for the dataset at `path`, kept current as rows are appended
+load_cube = shared_loader(RollupCube, tail=_from_first_new_date, show_spinner="Building rollups...")
+
+
+def summarize(rows, start=None, end=None, selections=None, path=DATA_FILE):
+    """Return a CubeView for the current page filters.
+
+    Served from the shared cube when every active selection is a cube dimension;
+    otherwise (e.g. a doctor_id or wait_time filter) the already filtered `rows`
+    are rolled up instead.
+    """
+    selections = {column: values for column, values in (selections or {}).items() if values}
+    cube = load_cube(path)
+    if all(column in cube.dimensions for column in selections):
+        return cube.view(start, end, selections)
+    return RollupCube(rows).view()
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+# Supported bucket sizes and the name used for the bucket column in charts
+FREQUENCIES = {"D": "daily", "W": "weekly", "M": "monthly", "Q": "quarterly"}
+
+# Axis tick format per bucket size; only the bucket labels are ever formatted
+TICK_FORMATS = {"D": "%b %d", "W": "%b : %d", "M": "%b %Y", "Q": "Q%q %Y"}
+
+# Upper bound on the points (bars, markers) a single time chart is given,
+# roughly one per pixel pair on a full-width chart
+MAX_POINTS = 500
+
+# 1970-01-01 was a Thursday; shifting by 3 days makes weeks start on Monday
+_WEEK_SHIFT = 3
+
+
+def bucket_keys(dates, freq="W"):
+    """Integer bucket key per date: days, Monday-weeks, months or quarters since 1970.
+
+    Keys increase with time, so sorting by key is chronological.
+    """
+    if freq not in FREQUENCIES:
+        raise ValueError(f"unsupported frequency: {freq}")
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    if freq in ("D", "W"):
+        days = dates.astype("datetime64[D]").astype(np.int64)
+        return days if freq == "D" else (days + _WEEK_SHIFT) // 7
+    months = dates.astype("datetime64[M]").astype(np.int64)
+    return months if freq == "M" else months // 3
+
+
+def bucket_starts(keys, freq="W"):
+    """First day of each bucket for keys from `bucket_keys`."""
+    keys = np.asarray(keys, dtype=np.int64)
+    if freq == "D":
+        return pd.DatetimeIndex(keys.astype("datetime64[D]"))
+    if freq == "W":
+        return pd.DatetimeIndex((keys * 7 - _WEEK_SHIFT).astype("datetime64[D]"))
+    months = keys if freq == "M" else keys * 3
+    return pd.DatetimeIndex(months.astype("datetime64[M]"))
+
+
+def time_buckets(df, columns, freq="W", how="sum"):
+    """Aggregate `columns` of a date-indexed frame per time bucket, in chronological order.
+
+    The result is indexed by bucket start and the index is named after the
+    frequency ("daily", "weekly", ...), ready for ``reset_index()`` and plotting.
+    `how` is "sum" or "mean".
+    """
+    if how not in ("sum", "mean"):
+        raise ValueError(f"unsupported aggregation: {how}")
+    keys = bucket_keys(df.index, freq)
+    order = None
+    if not (keys[1:] >= keys[:-1]).all():
+        # Date-sorted input is the usual case; anything else is sorted once here
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+    # Buckets are runs of equal keys
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(keys)])
+    result = {}
+    for column in columns:
+        values = df[column].to_numpy()
+        values = values if order is None else values[order]
+        # Widen before summing so large buckets don't overflow
+        values = values.astype(np.float64 if values.dtype.kind == "f" or how == "mean" else np.int64)
+        sums = np.add.reduceat(values, starts) if len(values) else values
+        result[column] = sums / counts if how == "mean" else sums
+    index = bucket_starts(keys[starts], freq).rename(FREQUENCIES[freq])
+    return pd.DataFrame(result, index=index)
+
+
+def fit_frequency(dates, max_buckets):
+    """Finest frequency that splits the span of `dates` into at most `max_buckets` buckets."""
+    if not len(dates):
+        return "D"
+    span = np.asarray([dates.min(), dates.max()], dtype="datetime64[ns]")
+    for freq in FREQUENCIES:
+        first, last = bucket_keys(span, freq)
+        if last - first + 1 <= max_buckets:
+            return freq
+    return "Q"
+
+
+def minmax_downsample(series, max_points=MAX_POINTS):
+    """Thin a chronological series to at most `max_points` points, keeping the shape.
+
+    The series is cut into `max_points // 2` equal runs and only the minimum and
+    maximum of each run are kept, so peaks and dips survive while the number of
+    points sent to the browser no longer depends on the date range.
+    """
+    n = len(series)
+    if n <= max_points:
+        return series
+    buckets = max(1, max_points // 2)
+    size = -(-n // buckets)
+    # Pad to a full (buckets x size) grid with NaN, which nanargmin/nanargmax skip
+    values = np.full(buckets * size, np.nan)
+    values[:n] = series.to_numpy(dtype=np.float64)
+    grid = values.reshape(buckets, size)
+    filled = ~np.isnan(grid).all(axis=1)
+    offsets = np.arange(buckets)[filled] * size
+    lows = offsets + np.nanargmin(grid[filled], axis=1)
+    highs = offsets + np.nanargmax(grid[filled], axis=1)
+    return series.iloc[np.unique(np.r_[lows, highs])]